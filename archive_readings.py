@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Move completed months of readings from DynamoDB into ARCHIVE_DIR.
+
+Each month becomes one compressed file of per-device, per-day blocks and its
+items are deleted from the table. DynamoDBClient reads archived months from
+ARCHIVE_DIR transparently, so chart_data.py keeps working across both.
+"""
+
+import argparse
+import os
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from chart_data import setup_aws
+from src.storage import DynamoDBClient, ReadingArchive
+
+load_dotenv()
+
+
+def month_strings(start_month, end_month):
+    """List every YYYY-MM month from start_month to end_month inclusive"""
+    year, month = map(int, start_month.split("-"))
+    months = []
+    while f"{year:04d}-{month:02d}" <= end_month:
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive completed months")
+    parser.add_argument(
+        "--start", type=str, required=True, help="First month (YYYY-MM)"
+    )
+    parser.add_argument(
+        "--end",
+        type=str,
+        help="Last month (YYYY-MM), defaults to --keep-months before this one",
+    )
+    parser.add_argument(
+        "--keep-months",
+        type=int,
+        default=3,
+        help="Recent completed months to leave in DynamoDB (default: 3)",
+    )
+    args = parser.parse_args()
+
+    archive_dir = os.getenv("ARCHIVE_DIR")
+    if not archive_dir:
+        print("Set ARCHIVE_DIR to the archive directory")
+        return 1
+
+    end_month = args.end
+    if end_month is None:
+        now = datetime.now(timezone.utc)
+        months_back = now.year * 12 + now.month - 1 - (args.keep_months + 1)
+        end_month = f"{months_back // 12:04d}-{months_back % 12 + 1:02d}"
+
+    setup_aws()
+    client = DynamoDBClient(
+        os.environ["DYNAMODB_TABLE"], archive=ReadingArchive(archive_dir)
+    )
+
+    for month in month_strings(args.start, end_month):
+        count = client.archive_month(month)
+        print(f"{month}: archived {count} readings")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
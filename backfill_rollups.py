@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""Rebuild hourly and daily rollups from raw readings for a range of UTC days.
+
+Run this once after turning on ROLLUPS_ENABLED so chart_data.py has rollups
+for history written before the poller started maintaining them.
+"""
+
+import argparse
+import os
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from chart_data import setup_aws
+from src.storage import DynamoDBClient
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild reading rollups")
+    parser.add_argument("--start", type=str, required=True, help="UTC start date")
+    parser.add_argument(
+        "--end", type=str, help="UTC end date (YYYY-MM-DD), defaults to today"
+    )
+    args = parser.parse_args()
+
+    end_date = args.end or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    setup_aws()
+    client = DynamoDBClient(os.environ["DYNAMODB_TABLE"])
+
+    for date_str in client.date_strings(args.start, end_date):
+        count = client.rebuild_rollups(date_str)
+        print(f"{date_str}: wrote {count} rollups")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
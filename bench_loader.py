@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""Compare the two ways chart_data.py can turn DynamoDB items into a DataFrame.
+
+  current:  resource deserializer (Decimal) -> convert_decimal_to_float ->
+            pd.DataFrame(list_of_dicts)
+  columnar: DynamoDBClient.load_columns_time_window, which decodes the wire
+            format straight into numpy columns
+
+DynamoDB is replaced by an in-process stub that serves pre-generated,
+wire-format query pages, so only decoding cost is measured.
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from chart_data import convert_decimal_to_float
+from src.storage import DynamoDBClient
+
+# Roughly what fits in one 1 MB query page
+ITEMS_PER_PAGE = 3000
+
+
+def synthetic_partitions(start, days, devices, interval_minutes):
+    """Return {date_str: [wire-format items]} of realistic readings"""
+    rng = random.Random(42)
+    partitions = {}
+    step = interval_minutes * 60
+    start_ts = int(start.timestamp())
+
+    for i in range(days * 24 * 60 // interval_minutes):
+        timestamp = start_ts + i * step
+        moment = datetime.fromtimestamp(timestamp, timezone.utc)
+        date_str = moment.strftime("%Y-%m-%d")
+        for device in range(devices):
+            device_short_id = f"device{device:02d}"
+            partitions.setdefault(date_str, []).append(
+                {
+                    "date": {"S": date_str},
+                    "timestamp_device": {"S": f"{timestamp}#{device_short_id}"},
+                    "device_id": {"S": f"enterprises/bench/devices/{device_short_id}"},
+                    "device_name": {"S": f"Room {device}"},
+                    "timestamp": {"N": str(timestamp)},
+                    "readable_time": {"S": moment.replace(tzinfo=None).isoformat()},
+                    "temperature_celsius": {"N": f"{rng.uniform(17, 24):.2f}"},
+                    "humidity_percent": {"N": str(rng.randint(30, 60))},
+                }
+            )
+    return partitions
+
+
+class StubLowLevelClient:
+    """Serves wire-format pages the way client.query would"""
+
+    def __init__(self, partitions):
+        self.partitions = partitions
+
+    def query(self, **kwargs):
+        values = kwargs["ExpressionAttributeValues"]
+        items = self.partitions.get(values[":date"]["S"], [])
+        if ":start" in values:
+            low, high = values[":start"]["S"], values[":end"]["S"]
+            items = [i for i in items if low <= i["timestamp_device"]["S"] <= high]
+        if ":prefix" in values:
+            prefix = values[":prefix"]["S"]
+            items = [i for i in items if i["timestamp_device"]["S"].startswith(prefix)]
+
+        start = kwargs.get("ExclusiveStartKey", {}).get("offset", 0)
+        response = {"Items": items[start : start + ITEMS_PER_PAGE]}
+        if start + ITEMS_PER_PAGE < len(items):
+            response["LastEvaluatedKey"] = {"offset": start + ITEMS_PER_PAGE}
+        return response
+
+
+class StubTable:
+    """Resource-style table; DynamoDBClient queries go to the low-level client"""
+
+    def __init__(self, client):
+        self.client = client
+
+
+class StubResource:
+    def __init__(self, client):
+        self.table = StubTable(client)
+
+    def Table(self, name):
+        return self.table
+
+
+def current_path(client, start, end):
+    readings = client.get_readings_time_window(start, end, max_workers=1)
+    readings = [convert_decimal_to_float(reading) for reading in readings]
+    return pd.DataFrame(readings)
+
+
+def columnar_path(client, start, end):
+    return pd.DataFrame(client.load_columns_time_window(start, end, max_workers=1))
+
+
+def measure(function, *args):
+    """Time one run, then repeat it under tracemalloc for peak memory"""
+    started = time.perf_counter()
+    df = function(*args)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the DynamoDB loaders")
+    parser.add_argument("--days", type=int, default=365, help="Days of data")
+    parser.add_argument("--devices", type=int, default=5, help="Devices per poll")
+    parser.add_argument("--interval", type=int, default=15, help="Minutes per poll")
+    parser.add_argument("--json", type=str, help="Write results to this file")
+    args = parser.parse_args()
+
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    end = start + timedelta(days=args.days) - timedelta(seconds=1)
+
+    print(
+        f"Generating {args.days} days x {args.devices} devices "
+        f"every {args.interval} minutes..."
+    )
+    stub = StubLowLevelClient(
+        synthetic_partitions(start, args.days, args.devices, args.interval)
+    )
+
+    client = DynamoDBClient("bench-table", dynamodb=StubResource(stub), rollups=False)
+    client._client = stub
+
+    results = {}
+    for name, function in (("current", current_path), ("columnar", columnar_path)):
+        df, elapsed, peak = measure(function, client, start, end)
+        results[name] = {
+            "rows": len(df),
+            "seconds": elapsed,
+            "peak_mb": peak / 1024 / 1024,
+        }
+        print(
+            f"  {name:9s} {len(df):8d} rows  {elapsed:7.2f} s  "
+            f"peak {peak / 1024 / 1024:7.1f} MB"
+        )
+
+    speedup = results["current"]["seconds"] / results["columnar"]["seconds"]
+    print(f"Columnar loader is {speedup:.1f}x faster")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"Results saved to {args.json}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""Measure cold-start cost of src/lambda_function.py against local stubs.
+
+Each run happens in a fresh interpreter so the numbers reflect a real cold
+start: module import time, the first lambda_handler invocation (which pays
+for the lazily imported boto3/requests) and a second, warm invocation.
+Nothing leaves the machine; Nest, OpenWeather and DynamoDB are stubbed.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+
+STUB_ENV = {
+    "NEST_CLIENT_ID": "bench-client",
+    "NEST_CLIENT_SECRET": "bench-secret",
+    "NEST_REFRESH_TOKEN": "bench-refresh",
+    "NEST_PROJECT_ID": "bench-project",
+    "OPENWEATHER_API_KEY": "bench-key",
+    "DYNAMODB_TABLE": "bench-table",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "fake",
+    "AWS_SECRET_ACCESS_KEY": "fake",
+}
+
+
+class StubResponse:
+    def __init__(self, data):
+        self.data = data
+        self.status_code = 200
+        self.headers = {}
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+
+def stub_device(index):
+    return {
+        "name": f"enterprises/bench-project/devices/device{index}",
+        "type": "sdm.devices.types.THERMOSTAT",
+        "traits": {
+            "sdm.devices.traits.Info": {"customName": f"Room {index}"},
+            "sdm.devices.traits.Temperature": {"ambientTemperatureCelsius": 20.5},
+            "sdm.devices.traits.Humidity": {"ambientHumidityPercent": 41},
+        },
+    }
+
+
+def stub_request(device_count):
+    def request(method, url, **kwargs):
+        if "oauth2" in url:
+            return StubResponse({"access_token": "bench-token", "expires_in": 3599})
+        if url.endswith("/devices"):
+            return StubResponse(
+                {"devices": [stub_device(i) for i in range(device_count)]}
+            )
+        if "onecall" in url:
+            return StubResponse(
+                {
+                    "current": {
+                        "temp": 4.2,
+                        "humidity": 70,
+                        "weather": [{"description": "clear sky"}],
+                        "feels_like": 1.3,
+                        "pressure": 1012,
+                    }
+                }
+            )
+        return StubResponse(stub_device(0))
+
+    return request
+
+
+def run_worker(device_count, invocations):
+    """Runs inside the child interpreter and prints timings as JSON"""
+    from time import perf_counter
+
+    sys.path.insert(0, SRC_DIR)
+    os.environ.update(STUB_ENV)
+    os.environ["CLIENT_REUSE"] = "true"
+    os.environ.pop("TOKEN_CACHE_FILE", None)
+    os.environ.pop("TOKEN_CACHE_DYNAMODB", None)
+
+    start = perf_counter()
+    import lambda_function
+
+    import_ms = (perf_counter() - start) * 1000
+
+    # Wrap the lazy factories so the real libraries are still imported on
+    # first use, but no request ever goes over the network
+    create_session = lambda_function.create_session
+    get_dynamodb_resource = lambda_function.get_dynamodb_resource
+
+    def stub_session(*args, **kwargs):
+        session = create_session(*args, **kwargs)
+        session.request = stub_request(device_count)
+        return session
+
+    def stub_dynamodb_resource():
+        from botocore.stub import Stubber
+
+        resource = get_dynamodb_resource()
+        stubber = Stubber(resource.meta.client)
+        for _ in range(invocations * (device_count // 25 + 2)):
+            stubber.add_response("batch_write_item", {"UnprocessedItems": {}})
+        stubber.activate()
+        return resource
+
+    lambda_function.create_session = stub_session
+    lambda_function.get_dynamodb_resource = stub_dynamodb_resource
+
+    invocation_ms = []
+    for _ in range(invocations):
+        start = perf_counter()
+        result = lambda_function.lambda_handler({}, None)
+        invocation_ms.append((perf_counter() - start) * 1000)
+        if result["statusCode"] != 200:
+            raise RuntimeError(f"lambda_handler failed: {result['body']}")
+
+    print(
+        json.dumps(
+            {
+                "import_ms": import_ms,
+                "first_invocation_ms": invocation_ms[0],
+                "warm_invocation_ms": invocation_ms[1:],
+            }
+        )
+    )
+
+
+# lambda_function first, then the dependencies it loads lazily on first use
+IMPORT_MODULES = ("lambda_function", "requests", "boto3")
+
+
+def measure_import_times():
+    """Return per-module import times (ms) using python -X importtime"""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import " + ", ".join(IMPORT_MODULES),
+        ],
+        cwd=SRC_DIR,
+        env={**os.environ, **STUB_ENV},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append(
+            {
+                "module": name.strip(),
+                "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            }
+        )
+    return modules
+
+
+def run_startup(device_count, invocations):
+    result = subprocess.run(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--worker",
+            "--devices",
+            str(device_count),
+            "--invocations",
+            str(invocations),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lambda cold start")
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts to sample")
+    parser.add_argument("--devices", type=int, default=5, help="Stubbed devices")
+    parser.add_argument(
+        "--invocations", type=int, default=3, help="Invocations per cold start"
+    )
+    parser.add_argument("--top", type=int, default=15, help="Modules to list")
+    parser.add_argument("--json", type=str, help="Write results to this file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.devices, max(1, args.invocations))
+        return 0
+
+    runs = [
+        run_startup(args.devices, max(2, args.invocations)) for _ in range(args.runs)
+    ]
+    modules = measure_import_times()
+
+    def median(values):
+        values = sorted(values)
+        return values[len(values) // 2]
+
+    summary = {
+        "import_ms": median([r["import_ms"] for r in runs]),
+        "first_invocation_ms": median([r["first_invocation_ms"] for r in runs]),
+        "warm_invocation_ms": median(
+            [ms for r in runs for ms in r["warm_invocation_ms"]]
+        ),
+    }
+
+    print(f"=== lambda_function cold start ({args.runs} runs, median) ===")
+    print(f"  Module import:     {summary['import_ms']:8.1f} ms")
+    print(f"  First invocation:  {summary['first_invocation_ms']:8.1f} ms")
+    print(f"  Warm invocation:   {summary['warm_invocation_ms']:8.1f} ms")
+
+    print("\n=== Import time per top-level module ===")
+    for module in modules:
+        if module["depth"] == 0 and module["module"] in IMPORT_MODULES:
+            print(f"  {module['cumulative_ms']:8.1f} ms  {module['module']}")
+
+    print(f"\n=== Slowest imported modules (top {args.top}) ===")
+    for module in sorted(modules, key=lambda m: m["cumulative_ms"], reverse=True)[
+        : args.top
+    ]:
+        print(
+            f"  {module['cumulative_ms']:8.1f} ms cumulative "
+            f"{module['self_ms']:7.1f} ms self  {module['module']}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {"summary": summary, "runs": runs, "imports": modules}, f, indent=2
+            )
+        print(f"\nResults saved to {args.json}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
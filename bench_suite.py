@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""Benchmark the read/write pipeline at 1-day, 1-month and 1-year scales.
+
+For every scale a fresh table is loaded with synthetic readings and these
+are timed:
+
+  save_readings            DynamoDBClient.save_readings of the whole range
+  get_readings_date_range  DynamoDBClient.get_readings_date_range
+  fetch_data               chart_data.fetch_data (raw, no local cache)
+  print_summary            chart_data.print_summary
+  create_charts            chart_data.create_charts to a PNG
+
+The default backend is an in-process stub that keeps items in DynamoDB's
+wire format, so only client-side cost is measured. --endpoint runs against
+DynamoDB Local instead (docker-compose up -d dynamodb-local).
+
+Results go to bench_results/<commit>.json; pass --compare with an older
+file to print the change per operation.
+"""
+
+import argparse
+import bisect
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import matplotlib
+
+# Must be selected before chart_data imports pyplot
+matplotlib.use("Agg")
+
+import chart_data  # noqa: E402
+import src.storage as storage  # noqa: E402
+from bench_loader import StubLowLevelClient, StubTable  # noqa: E402
+from boto3.dynamodb.types import TypeSerializer  # noqa: E402
+from src.storage import DynamoDBClient  # noqa: E402
+
+SCALES = {"day": 1, "month": 30, "year": 365}
+TABLE_NAME = "bench-readings"
+RESULTS_DIR = "bench_results"
+
+
+def synthetic_readings(start, days, devices, interval_minutes):
+    """Readings shaped like the poller's, with a daily cycle and noise"""
+    rng = random.Random(42)
+    step = interval_minutes * 60
+    start_ts = int(start.timestamp())
+    readings = []
+
+    for i in range(days * 24 * 60 // interval_minutes):
+        timestamp = start_ts + i * step
+        moment = datetime.fromtimestamp(timestamp, timezone.utc)
+        daily = math.sin(2 * math.pi * (timestamp % 86400) / 86400)
+        base = {
+            "date": moment.strftime("%Y-%m-%d"),
+            "timestamp": timestamp,
+            "readable_time": moment.replace(tzinfo=None).isoformat(),
+        }
+        for device in range(devices):
+            device_short_id = f"device{device:02d}"
+            readings.append(
+                dict(
+                    base,
+                    timestamp_device=f"{timestamp}#{device_short_id}",
+                    device_id=f"enterprises/bench/devices/{device_short_id}",
+                    device_name=f"Room {device}",
+                    temperature_celsius=round(
+                        20 + device * 0.5 + daily + rng.gauss(0, 0.2), 2
+                    ),
+                    humidity_percent=rng.randint(35, 50),
+                )
+            )
+        readings.append(
+            dict(
+                base,
+                timestamp_device=f"{timestamp}#outdoor_weather",
+                device_id="outdoor_weather",
+                device_name="Boston, MA (OpenWeather)",
+                temperature_celsius=round(5 + 6 * daily + rng.gauss(0, 0.5), 2),
+                humidity_percent=rng.randint(40, 90),
+                weather_description="clear sky",
+                feels_like_celsius=round(3 + 6 * daily, 2),
+                pressure_hpa=1012,
+            )
+        )
+    return readings
+
+
+class StubStore(StubLowLevelClient):
+    """bench_loader's query stub plus the writes save_readings makes"""
+
+    def __init__(self):
+        super().__init__({})
+        self.serializer = TypeSerializer()
+
+    def put_item(self, item):
+        wire = {k: self.serializer.serialize(v) for k, v in item.items()}
+        partition = self.partitions.setdefault(item["date"], [])
+        keys = [i["timestamp_device"]["S"] for i in partition]
+        position = bisect.bisect_left(keys, item["timestamp_device"])
+        if position < len(keys) and keys[position] == item["timestamp_device"]:
+            partition[position] = wire
+        else:
+            partition.insert(position, wire)
+
+
+class StubBatchWriter:
+    def __init__(self, store):
+        self.store = store
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def put_item(self, Item):
+        self.store.put_item(Item)
+
+
+class StubWritableTable(StubTable):
+    def batch_writer(self):
+        return StubBatchWriter(self.client)
+
+
+class StubResource:
+    def __init__(self, store):
+        self.table = StubWritableTable(store)
+
+    def Table(self, name):
+        return self.table
+
+
+def stub_backend():
+    """Point every DynamoDBClient (including chart_data's) at a fresh stub"""
+    store = StubStore()
+    resource = StubResource(store)
+    storage.get_dynamodb_resource = lambda: resource
+    DynamoDBClient._low_level_client = lambda self: store
+    return resource
+
+
+def local_backend(endpoint):
+    """Recreate the benchmark table in DynamoDB Local"""
+    import boto3
+
+    os.environ.update(
+        {
+            "LOCAL_DYNAMODB": "true",
+            "AWS_ACCESS_KEY_ID": "fake",
+            "AWS_SECRET_ACCESS_KEY": "fake",
+            "AWS_DEFAULT_REGION": "us-east-1",
+        }
+    )
+    resource = boto3.resource(
+        "dynamodb", endpoint_url=endpoint, region_name="us-east-1"
+    )
+    table = resource.Table(TABLE_NAME)
+    try:
+        table.delete()
+        table.wait_until_not_exists()
+    except resource.meta.client.exceptions.ResourceNotFoundException:
+        pass
+
+    table = resource.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[
+            {"AttributeName": "date", "KeyType": "HASH"},
+            {"AttributeName": "timestamp_device", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "date", "AttributeType": "S"},
+            {"AttributeName": "timestamp_device", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    table.wait_until_exists()
+    return resource
+
+
+def timed_runs(function, repeat):
+    """Run function repeat times with stdout silenced; return (result, seconds)"""
+    runs = []
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            result = function()
+            runs.append(time.perf_counter() - started)
+    return result, runs
+
+
+def run_scale(days, args, chart_dir):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    end = start + timedelta(days=days) - timedelta(seconds=1)
+    readings = synthetic_readings(start, days, args.devices, args.interval)
+
+    resource = local_backend(args.endpoint) if args.endpoint else stub_backend()
+    client = DynamoDBClient(TABLE_NAME, dynamodb=resource)
+
+    start_date = start.strftime("%Y-%m-%d")
+    end_date = end.strftime("%Y-%m-%d")
+    chart_path = os.path.join(chart_dir, f"bench-{days}.png")
+
+    operations = [
+        ("save_readings", lambda: client.save_readings(readings), 1),
+        (
+            "get_readings_date_range",
+            lambda: client.get_readings_date_range(start_date, end_date),
+            args.repeat,
+        ),
+        (
+            "fetch_data",
+            lambda: chart_data.fetch_data(start, end, use_cache=False),
+            args.repeat,
+        ),
+    ]
+
+    results = {"readings": len(readings)}
+    df = None
+    for name, function, repeat in operations:
+        value, runs = timed_runs(function, repeat)
+        if name == "fetch_data":
+            df = value
+        results[name] = {"seconds": sorted(runs)[len(runs) // 2], "runs": runs}
+
+    for name, function in (
+        ("print_summary", lambda: chart_data.print_summary(df)),
+        ("create_charts", lambda: chart_data.create_charts(df, save_path=chart_path)),
+    ):
+        _, runs = timed_runs(function, args.repeat)
+        results[name] = {"seconds": sorted(runs)[len(runs) // 2], "runs": runs}
+    return results
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_comparison(results, baseline):
+    print(f"\n=== Change vs {baseline.get('commit', 'baseline')} ===")
+    for scale, operations in results["results"].items():
+        old_operations = baseline["results"].get(scale, {})
+        for name, result in operations.items():
+            if name == "readings" or name not in old_operations:
+                continue
+            old = old_operations[name]["seconds"]
+            change = (result["seconds"] - old) / old * 100 if old else 0
+            print(
+                f"  {scale:6s} {name:24s} {old:8.3f} s -> "
+                f"{result['seconds']:8.3f} s  ({change:+.0f}%)"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the reading pipeline")
+    parser.add_argument(
+        "--scales",
+        type=str,
+        default="day,month,year",
+        help="Comma-separated scales to run (day, month, year)",
+    )
+    parser.add_argument("--devices", type=int, default=5, help="Indoor devices")
+    parser.add_argument("--interval", type=int, default=15, help="Minutes per poll")
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per read operation (median)"
+    )
+    parser.add_argument(
+        "--endpoint",
+        type=str,
+        help="DynamoDB Local endpoint, e.g. http://localhost:8000 (default: stub)",
+    )
+    parser.add_argument("--json", type=str, help="Results file to write")
+    parser.add_argument("--compare", type=str, help="Earlier results file")
+    args = parser.parse_args()
+
+    # Benchmark the plain storage path whatever .env enables
+    os.environ["DYNAMODB_TABLE"] = TABLE_NAME
+    for name in ("ROLLUPS_ENABLED", "DEADBAND_ENABLED"):
+        os.environ[name] = "false"
+    os.environ.pop("ARCHIVE_DIR", None)
+    if not args.endpoint:
+        os.environ.pop("LOCAL_DYNAMODB", None)
+
+    commit = current_commit()
+    output = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "backend": args.endpoint or "stub",
+        "args": vars(args),
+        "results": {},
+    }
+
+    with tempfile.TemporaryDirectory() as chart_dir:
+        for scale in args.scales.split(","):
+            days = SCALES[scale]
+            print(f"=== {scale} ({days} days) ===")
+            results = run_scale(days, args, chart_dir)
+            output["results"][scale] = results
+            print(f"  {results['readings']} readings")
+            for name, result in results.items():
+                if name != "readings":
+                    print(f"  {name:24s} {result['seconds']:8.3f} s")
+
+    path = args.json or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"\nResults saved to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(output, json.load(f))
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -2,16 +2,31 @@
 
 import argparse
 import os
+import time
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from dotenv import load_dotenv
-from src.lambda_function import DynamoDBClient
+from src.storage import DynamoDBClient, as_utc
+from reading_cache import ReadingCache
 import boto3
 import pytz
 
+# Ranges up to these spans are charted from raw readings / hourly rollups,
+# anything longer uses daily rollups
+RAW_RESOLUTION_MAX_SPAN = timedelta(days=3)
+HOURLY_RESOLUTION_MAX_SPAN = timedelta(days=60)
+
+# Series with more points than this are drawn without markers
+MARKER_MAX_POINTS = 200
+
+# The poller's schedule; in deadband mode (DEADBAND_ENABLED) unchanged
+# readings are not written and are step-filled back in at this interval
+POLL_INTERVAL_SECONDS = 15 * 60
+
 environment = os.getenv('ENVIRONMENT', 'production')
 load_dotenv('.env')
 load_dotenv(f".env.{environment}")
@@ -48,30 +63,124 @@ def convert_decimal_to_float(obj):
     else:
         return obj
 
-def fetch_data(start_date, end_date, local_tz=None):
-    """Fetch temperature data from DynamoDB with timezone support"""
+def readings_to_frame(readings):
+    """Build a DataFrame from DynamoDB items"""
+    # Convert Decimal objects to float
+    return pd.DataFrame([convert_decimal_to_float(reading) for reading in readings])
+
+def fetch_cached_frame(client, cache, start_time, end_time, refresh=False):
+    """Read a UTC window through the on-disk cache of completed days"""
+    start_time = as_utc(start_time)
+    end_time = as_utc(end_time)
+    dates = client.date_strings(start_time.strftime('%Y-%m-%d'), end_time.strftime('%Y-%m-%d'))
+    
+    frames = {}
+    missing = []
+    live = []
+    for date_str in dates:
+        if not cache.is_complete(date_str):
+            live.append(date_str)
+            continue
+        cached = None if refresh else cache.get(date_str)
+        if cached is None:
+            missing.append(date_str)
+        else:
+            frames[date_str] = cached
+    
+    print(f"Cache: {len(frames)} day(s) cached, {len(missing)} to fetch, {len(live)} live")
+    
+    # Completed days are fetched whole so they can be cached permanently
+    for date_str, columns in client.load_columns_for_dates(missing).items():
+        frames[date_str] = pd.DataFrame(columns)
+        cache.put(date_str, frames[date_str])
+    
+    # The current day is still changing, so only its window is read
+    if live:
+        live_start = max(start_time, datetime.strptime(live[0], '%Y-%m-%d').replace(tzinfo=timezone.utc))
+        frames[live[0]] = pd.DataFrame(client.load_columns_time_window(live_start, end_time))
+    
+    frames = [frames[date_str] for date_str in dates if date_str in frames and not frames[date_str].empty]
+    if not frames:
+        return pd.DataFrame()
+    
+    df = pd.concat(frames, ignore_index=True)
+    start_ts = int(start_time.timestamp())
+    end_ts = int(end_time.timestamp())
+    return df[(df['timestamp'] >= start_ts) & (df['timestamp'] <= end_ts)].reset_index(drop=True)
+
+def choose_resolution(start_time, end_time):
+    """Pick raw readings, hourly or daily rollups from the span of the range"""
+    span = end_time - start_time
+    if span <= RAW_RESOLUTION_MAX_SPAN:
+        return 'raw'
+    if span <= HOURLY_RESOLUTION_MAX_SPAN:
+        return 'hour'
+    return 'day'
+
+def fetch_data(start_time, end_time, local_tz=None, use_cache=True, refresh=False, resolution='raw'):
+    """Fetch temperature data between two UTC datetimes with timezone support
+    
+    resolution is 'raw', 'hour', 'day' or 'auto' (picked from the span).
+    Rollups carry per-bucket means plus _min/_max/_count columns.
+    """
     setup_aws()
     
     table_name = os.environ['DYNAMODB_TABLE']
     client = DynamoDBClient(table_name)
     
-    print(f"Fetching data from {start_date} to {end_date} (UTC dates)...")
+    if resolution == 'auto':
+        resolution = choose_resolution(start_time, end_time)
     
-    # Get readings for the date range
-    readings = client.get_readings_date_range(start_date, end_date)
+    print(f"Fetching {resolution} data from {start_time} to {end_time} (UTC)...")
+    
+    df = pd.DataFrame()
+    if resolution != 'raw':
+        df = readings_to_frame(client.get_rollups_time_window(resolution, start_time, end_time))
+        if df.empty:
+            print("No rollups found (see backfill_rollups.py), falling back to raw readings")
+    
+    if df.empty:
+        if use_cache:
+            df = fetch_cached_frame(client, ReadingCache(source=ReadingCache.source_for(client)), start_time, end_time, refresh)
+        else:
+            # Only the rows inside the window are read from each UTC day,
+            # decoded straight into float64/int64 columns
+            df = pd.DataFrame(client.load_columns_time_window(start_time, end_time))
+        
+        if os.getenv('DEADBAND_ENABLED', 'false').lower() == 'true':
+            df = deadband_fill(client, df, start_time, end_time)
     
-    if not readings:
+    if df.empty:
         print("No data found for the specified date range")
         return pd.DataFrame()
     
-    # Convert Decimal objects to float
-    readings = [convert_decimal_to_float(reading) for reading in readings]
-    
-    print(f"Found {len(readings)} readings")
+    print(f"Found {len(df)} rows")
     
-    # Convert to DataFrame
-    df = pd.DataFrame(readings)
+    return add_local_time(df, local_tz)
+
+def deadband_fill(client, df, start_time, end_time):
+    """Step-fill raw readings written in deadband mode (see step_fill)
+    
+    Each device's last reading from up to a heartbeat before start_time is
+    carried into the window too, so the chart does not begin at the first
+    change inside it.
+    """
+    heartbeat = float(os.getenv('DEADBAND_HEARTBEAT_MINUTES', 60)) * 60
+    start_time = as_utc(start_time)
+    before = pd.DataFrame(client.load_columns_time_window(
+        start_time - timedelta(seconds=heartbeat), start_time - timedelta(seconds=1)))
+    if not before.empty:
+        last = before.sort_values('timestamp', kind='stable').groupby('device_id').tail(1)
+        df = pd.concat([last, df], ignore_index=True)
+    if df.empty:
+        return df
     
+    until = min(as_utc(end_time), datetime.now(timezone.utc)).timestamp()
+    df = step_fill(df, heartbeat, until=until)
+    return df[df['timestamp'] >= int(start_time.timestamp())].reset_index(drop=True)
+
+def add_local_time(df, local_tz=None):
+    """Add datetime (naive, local if local_tz is given) and local_date columns"""
     # Convert timestamp to datetime in UTC first, then to local timezone if specified
     df['datetime_utc'] = pd.to_datetime(df['timestamp'], unit='s', utc=True)
     
@@ -88,29 +197,162 @@ def fetch_data(start_date, end_date, local_tz=None):
     
     return df
 
-def create_charts(df, save_path=None):
-    """Create temperature and humidity charts"""
+def step_fill(df, heartbeat, interval=POLL_INTERVAL_SECONDS, until=None):
+    """Repeat each reading at the poll interval until the device's next one
+    
+    Deadband mode only writes readings that changed, so a skipped poll means
+    "same as before". Gaps longer than the heartbeat are left alone, they
+    are real outages rather than skipped writes. A device's last reading is
+    carried forward up to until (a UTC timestamp), within the heartbeat.
+    """
+    if df.empty:
+        return df
+    
+    df = df.sort_values(['device_id', 'timestamp'], kind='stable').reset_index(drop=True)
+    gap = df.groupby('device_id')['timestamp'].shift(-1) - df['timestamp']
+    # Allow one interval of slack for scheduling jitter
+    fill = gap.notna() & (gap > interval) & (gap <= heartbeat + interval)
+    repeats = np.where(fill, np.round(gap.fillna(0) / interval), 1)
+    if until is not None:
+        tail = np.floor((until - df['timestamp']) / interval) + 1
+        tail = np.clip(tail, 1, max(1, heartbeat // interval))
+        repeats = np.where(gap.isna(), tail, repeats)
+    repeats = np.maximum(repeats, 1).astype(np.int64)
+    
+    filled = df.loc[df.index.repeat(repeats)]
+    offsets = filled.groupby(level=0).cumcount().to_numpy()
+    filled = filled.reset_index(drop=True)
+    filled['timestamp'] = filled['timestamp'] + offsets * interval
+    return filled.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+def decimate_lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling to about threshold points
+    
+    Keeps the first and last points and, from each bucket in between, the
+    point forming the largest triangle with its neighbours, so peaks survive.
+    Returns the indices of the points to keep.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third vertex
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        keep[i + 1] = previous
+    return keep
+
+def decimate_minmax(x, y, threshold):
+    """Keep the minimum and maximum of each of threshold/2 buckets, in order"""
+    n = len(x)
+    if threshold >= n or threshold < 2:
+        return np.arange(n)
+    
+    edges = np.linspace(0, n, threshold // 2 + 1).astype(np.int64)
+    keep = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if start == end:
+            continue
+        bucket = y[start:end]
+        keep.extend(sorted({start + int(np.argmin(bucket)), start + int(np.argmax(bucket))}))
+    return np.asarray(keep, dtype=np.int64)
+
+DECIMATORS = {'lttb': decimate_lttb, 'minmax': decimate_minmax}
+
+def plot_series(ax, times, values, max_points, method='lttb', **kwargs):
+    """Plot one device series, decimated to about max_points points"""
+    mask = values.notna().to_numpy()
+    x = times.to_numpy()[mask]
+    y = values.to_numpy(dtype=np.float64)[mask]
+    
+    if method in DECIMATORS and len(x) > max_points:
+        keep = DECIMATORS[method](x.astype('datetime64[ns]').astype(np.int64), y, max_points)
+        x, y = x[keep], y[keep]
+    
+    if len(x) <= MARKER_MAX_POINTS:
+        kwargs.update(marker='o', markersize=3)
+    return ax.plot(x, y, **kwargs)[0]
+
+def format_time_axis(ax, start, end):
+    """Pick tick spacing and label format from the span being charted"""
+    span = end - start
+    if span <= timedelta(days=2):
+        fmt = '%m/%d %H:%M'
+    elif span <= timedelta(days=180):
+        fmt = '%m/%d'
+    else:
+        fmt = '%Y-%m-%d'
+    
+    ax.xaxis.set_major_locator(mdates.AutoDateLocator(minticks=4, maxticks=12))
+    ax.xaxis.set_major_formatter(mdates.DateFormatter(fmt))
+    plt.setp(ax.xaxis.get_majorticklabels(), rotation=45)
+
+def create_charts(df, save_path=None, decimate='lttb', title='Temperature and Humidity Over Time'):
+    """Create temperature and humidity charts
+    
+    Each device series is decimated ('lttb', 'minmax' or 'none') to roughly
+    the pixel width of the axes, so render time barely grows with the range.
+    """
     if df.empty:
         print("No data to chart")
         return
     
+    fig, _, _ = draw_charts(df, decimate, title)
+    
+    # Save or show
+    if save_path:
+        plt.savefig(save_path, dpi=300, bbox_inches='tight')
+        plt.close(fig)
+        print(f"Chart saved to {save_path}")
+    else:
+        plt.show()
+
+def chart_values(device_data, metric):
+    """The values charted for a metric; temperatures are shown in Fahrenheit"""
+    if metric == 'temperature_celsius':
+        return device_data[metric] * 9/5 + 32
+    return device_data[metric]
+
+def draw_charts(df, decimate='lttb', title='Temperature and Humidity Over Time'):
+    """Draw both charts, returning (fig, {metric: ax}, {(metric, device): line})"""
     # Set up the plot style
     plt.style.use('default')
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10))
-    fig.suptitle('Temperature and Humidity Over Time', fontsize=16, fontweight='bold')
+    fig.suptitle(title, fontsize=16, fontweight='bold')
+    
+    # More points than horizontal pixels cannot be told apart
+    max_points = max(int(ax1.bbox.width), 10)
     
     # Get unique devices
     devices = df['device_name'].unique()
     colors = plt.cm.tab10(range(len(devices)))
     
+    lines = {}
+    
     # Temperature chart (convert to Fahrenheit)
     for i, device in enumerate(devices):
         device_data = df[df['device_name'] == device]
         if 'temperature_celsius' in device_data.columns and device_data['temperature_celsius'].notna().any():
-            # Convert Celsius to Fahrenheit
-            temp_fahrenheit = device_data['temperature_celsius'] * 9/5 + 32
-            ax1.plot(device_data['datetime'], temp_fahrenheit, 
-                    label=device, color=colors[i], linewidth=2, marker='o', markersize=3)
+            lines['temperature_celsius', device] = plot_series(
+                ax1, device_data['datetime'], chart_values(device_data, 'temperature_celsius'), max_points, decimate,
+                label=device, color=colors[i], linewidth=2)
     
     ax1.set_title('Temperature (°F)', fontsize=14, fontweight='bold')
     ax1.set_ylabel('Temperature (°F)', fontsize=12)
@@ -118,16 +360,16 @@ def create_charts(df, save_path=None):
     ax1.legend()
     
     # Format x-axis for temperature
-    ax1.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d %H:%M'))
-    ax1.xaxis.set_major_locator(mdates.HourLocator(interval=1))
-    plt.setp(ax1.xaxis.get_majorticklabels(), rotation=45)
+    start, end = df['datetime'].min(), df['datetime'].max()
+    format_time_axis(ax1, start, end)
     
     # Humidity chart
     for i, device in enumerate(devices):
         device_data = df[df['device_name'] == device]
         if 'humidity_percent' in device_data.columns and device_data['humidity_percent'].notna().any():
-            ax2.plot(device_data['datetime'], device_data['humidity_percent'], 
-                    label=device, color=colors[i], linewidth=2, marker='o', markersize=3)
+            lines['humidity_percent', device] = plot_series(
+                ax2, device_data['datetime'], device_data['humidity_percent'], max_points, decimate,
+                label=device, color=colors[i], linewidth=2)
     
     ax2.set_title('Humidity (%)', fontsize=14, fontweight='bold')
     ax2.set_ylabel('Humidity (%)', fontsize=12)
@@ -136,19 +378,105 @@ def create_charts(df, save_path=None):
     ax2.legend()
     
     # Format x-axis for humidity
-    ax2.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d %H:%M'))
-    ax2.xaxis.set_major_locator(mdates.HourLocator(interval=1))
-    plt.setp(ax2.xaxis.get_majorticklabels(), rotation=45)
+    format_time_axis(ax2, start, end)
     
     # Adjust layout
     plt.tight_layout()
     
-    # Save or show
-    if save_path:
-        plt.savefig(save_path, dpi=300, bbox_inches='tight')
-        print(f"Chart saved to {save_path}")
-    else:
-        plt.show()
+    return fig, {'temperature_celsius': ax1, 'humidity_percent': ax2}, lines
+
+def follow_charts(df, start_time, end_time, local_tz=None, interval=60, save_path=None,
+                  decimate='lttb', title='Temperature and Humidity Over Time'):
+    """Keep the charts open and add new readings as they are written
+    
+    Each refresh range-queries only the keys from the newest timestamp
+    seen, appends the rows not seen yet to df and extends the existing
+    lines in place, so its cost depends only on what arrived. With
+    save_path the file is rewritten after every refresh instead.
+    """
+    client = DynamoDBClient(os.environ['DYNAMODB_TABLE'])
+    deadband = os.getenv('DEADBAND_ENABLED', 'false').lower() == 'true'
+    heartbeat = float(os.getenv('DEADBAND_HEARTBEAT_MINUTES', 60)) * 60
+    last_timestamp, seen = int(as_utc(start_time).timestamp()), set()
+    if not df.empty:
+        last_timestamp, seen = newest_keys(df['timestamp_device'])
+    charts = draw_charts(df, decimate, title) if not df.empty else None
+    
+    if charts and not save_path:
+        plt.show(block=False)
+    print(f"Following new readings every {interval}s until {end_time} (UTC), Ctrl+C to stop")
+    
+    try:
+        while True:
+            if charts and not save_path:
+                if not plt.fignum_exists(charts[0].number):
+                    break
+                plt.pause(interval)
+            else:
+                time.sleep(interval)
+            
+            new = pd.DataFrame(client.load_columns_after(last_timestamp, end_time, seen))
+            if new.empty:
+                continue
+            last_timestamp, seen = newest_keys(new['timestamp_device'], last_timestamp, seen)
+            
+            if deadband:
+                until = min(as_utc(end_time), datetime.now(timezone.utc)).timestamp()
+                new = step_fill(new, heartbeat, until=until)
+            new = add_local_time(new, local_tz)
+            df = pd.concat([df, new], ignore_index=True)
+            print(f"{datetime.now():%H:%M:%S} +{len(new)} rows ({len(df)} total)")
+            
+            if charts is None:
+                charts = draw_charts(df, decimate, title)
+                if not save_path:
+                    plt.show(block=False)
+            else:
+                extend_charts(charts, new)
+            
+            if save_path:
+                charts[0].savefig(save_path, dpi=300, bbox_inches='tight')
+                print(f"Chart saved to {save_path}")
+            else:
+                charts[0].canvas.draw_idle()
+    except KeyboardInterrupt:
+        pass
+    return df
+
+def newest_keys(keys, last_timestamp=None, seen=frozenset()):
+    """Return the newest timestamp among timestamp_device keys and the keys at it
+    
+    The timestamp is read from the keys rather than the timestamp column,
+    which step_fill shifts. The keys already seen at last_timestamp are kept
+    when nothing newer arrived.
+    """
+    stamps = keys.str.split('#').str[0].astype('int64')
+    newest = int(stamps.max())
+    at_newest = set(keys[stamps == newest])
+    if newest == last_timestamp:
+        at_newest |= seen
+    return newest, at_newest
+
+def extend_charts(charts, new):
+    """Append new rows to the existing lines, adding lines for new devices"""
+    fig, axes, lines = charts
+    for metric, ax in axes.items():
+        if metric not in new.columns:
+            continue
+        for device, device_data in new[new[metric].notna()].groupby('device_name'):
+            device_data = device_data.sort_values('timestamp', kind='stable')
+            x = device_data['datetime'].to_numpy()
+            y = chart_values(device_data, metric).to_numpy(dtype=np.float64)
+            line = lines.get((metric, device))
+            if line is None:
+                lines[metric, device] = ax.plot(x, y, label=device, linewidth=2,
+                                                color=plt.cm.tab10(len(lines) % 10))[0]
+                ax.legend()
+            else:
+                line.set_data(np.concatenate([line.get_xdata(), x]),
+                              np.concatenate([line.get_ydata(), y]))
+        ax.relim()
+        ax.autoscale_view()
 
 def print_summary(df):
     """Print data summary"""
@@ -157,23 +485,146 @@ def print_summary(df):
     
     print("\n=== Data Summary ===")
     print(f"Time range: {df['datetime'].min()} to {df['datetime'].max()}")
-    print(f"Total readings: {len(df)}")
+    if 'count' in df.columns:
+        print(f"Total readings: {int(df['count'].sum())} (in {len(df)} rollups)")
+    else:
+        print(f"Total readings: {len(df)}")
     
     print("\nDevices found:")
+    rollup = 'temperature_celsius_count' in df.columns
     for device in df['device_name'].unique():
         device_data = df[df['device_name'] == device]
-        count = len(device_data)
+        count = int(device_data['count'].sum()) if rollup else len(device_data)
         
         if 'temperature_celsius' in device_data.columns and device_data['temperature_celsius'].notna().any():
-            temp_avg_c = device_data['temperature_celsius'].mean()
+            if rollup:
+                # Weight each bucket by how many readings it holds
+                temp_avg_c = device_data['temperature_celsius_sum'].sum() / device_data['temperature_celsius_count'].sum()
+                temp_min_c = device_data['temperature_celsius_min'].min()
+                temp_max_c = device_data['temperature_celsius_max'].max()
+            else:
+                temp_avg_c = device_data['temperature_celsius'].mean()
+                temp_min_c = device_data['temperature_celsius'].min()
+                temp_max_c = device_data['temperature_celsius'].max()
             temp_avg_f = temp_avg_c * 9/5 + 32
-            temp_min_f = device_data['temperature_celsius'].min() * 9/5 + 32
-            temp_max_f = device_data['temperature_celsius'].max() * 9/5 + 32
+            temp_min_f = temp_min_c * 9/5 + 32
+            temp_max_f = temp_max_c * 9/5 + 32
             temp_range = f"{temp_min_f:.1f}-{temp_max_f:.1f}"
             print(f"  - {device}: {count} readings, avg temp {temp_avg_f:.1f}°F (range: {temp_range}°F)")
         else:
             print(f"  - {device}: {count} readings (no temperature data)")
 
+class RunningStats:
+    """Count, mean, variance, min and max of a stream of values
+    
+    Batches are merged with the parallel form of Welford's algorithm, so
+    state stays constant no matter how many values are seen. An optional
+    0.1-unit histogram gives approximate quantiles in bounded memory.
+    """
+    
+    def __init__(self, histogram=False):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.histogram = {} if histogram else None
+    
+    def update(self, values):
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        
+        count = len(values)
+        mean = values.mean()
+        m2 = ((values - mean) ** 2).sum()
+        
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        
+        if self.histogram is not None:
+            bins, counts = np.unique(np.round(values * 10).astype(np.int64), return_counts=True)
+            for b, c in zip(bins.tolist(), counts.tolist()):
+                self.histogram[b] = self.histogram.get(b, 0) + c
+    
+    @property
+    def std(self):
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+    
+    def quantile(self, q):
+        """Approximate quantile (to 0.1) from the histogram"""
+        target = q * (self.count - 1)
+        seen = 0
+        for b in sorted(self.histogram):
+            seen += self.histogram[b]
+            if seen > target:
+                return b / 10
+        return self.max
+
+def stream_summary(start_time, end_time, quantiles=()):
+    """Summarize readings per device page by page, in O(devices) memory"""
+    setup_aws()
+    client = DynamoDBClient(os.environ['DYNAMODB_TABLE'])
+    
+    stats = {}
+    first = last = None
+    for page in client.iter_column_pages(start_time, end_time):
+        first = page['timestamp'].min() if first is None else min(first, page['timestamp'].min())
+        last = page['timestamp'].max() if last is None else max(last, page['timestamp'].max())
+        
+        devices, device_index = np.unique(page['device_name'].astype(str), return_inverse=True)
+        for i, device in enumerate(devices):
+            rows = device_index == i
+            if device not in stats:
+                stats[device] = {
+                    'readings': 0,
+                    'temperature_celsius': RunningStats(histogram=bool(quantiles)),
+                    'humidity_percent': RunningStats(),
+                }
+            device_stats = stats[device]
+            device_stats['readings'] += int(rows.sum())
+            for metric in ('temperature_celsius', 'humidity_percent'):
+                if metric in page:
+                    device_stats[metric].update(page[metric][rows])
+    
+    return {'first': first, 'last': last, 'devices': stats}
+
+def print_stream_summary(summary, quantiles=()):
+    """Print a stream_summary result in the same shape as print_summary"""
+    if not summary['devices']:
+        print("No data found for the specified date range")
+        return
+    
+    def to_f(celsius):
+        return celsius * 9/5 + 32
+    
+    first = datetime.fromtimestamp(int(summary['first']), timezone.utc)
+    last = datetime.fromtimestamp(int(summary['last']), timezone.utc)
+    print("\n=== Data Summary (streamed) ===")
+    print(f"Time range: {first} to {last}")
+    print(f"Total readings: {sum(d['readings'] for d in summary['devices'].values())}")
+    
+    print("\nDevices found:")
+    for device, device_stats in summary['devices'].items():
+        temp = device_stats['temperature_celsius']
+        if not temp.count:
+            print(f"  - {device}: {device_stats['readings']} readings (no temperature data)")
+            continue
+        
+        line = (f"  - {device}: {device_stats['readings']} readings, avg temp {to_f(temp.mean):.1f}°F "
+                f"(range: {to_f(temp.min):.1f}-{to_f(temp.max):.1f}°F, std {temp.std * 9/5:.2f}°F)")
+        humidity = device_stats['humidity_percent']
+        if humidity.count:
+            line += f", avg humidity {humidity.mean:.0f}%"
+        print(line)
+        for q in quantiles:
+            print(f"      p{q * 100:g}: {to_f(temp.quantile(q)):.1f}°F")
+
 def calculate_utc_date_range(local_date_str, local_tz_str):
     """Calculate UTC date range needed to get all data for a local timezone day"""
     # Parse the local date
@@ -196,14 +647,6 @@ def calculate_utc_date_range(local_date_str, local_tz_str):
     
     return utc_start_date, utc_end_date, utc_start, utc_end
 
-def filter_data_by_local_date(df, target_local_date, local_tz_str):
-    """Filter dataframe to only include data from the target local date"""
-    if df.empty:
-        return df
-    
-    target_date = datetime.strptime(target_local_date, '%Y-%m-%d').date()
-    return df[df['local_date'] == target_date]
-
 def main():
     parser = argparse.ArgumentParser(description='Chart temperature and humidity data')
     parser.add_argument('--start', type=str, help='Start date (YYYY-MM-DD), defaults to today in local timezone')
@@ -211,7 +654,15 @@ def main():
     parser.add_argument('--timezone', type=str, default='America/New_York', help='Local timezone (default: America/New_York for EST/EDT)')
     parser.add_argument('--save', type=str, help='Save chart to file instead of displaying')
     parser.add_argument('--summary', action='store_true', help='Show data summary')
+    parser.add_argument('--stream-summary', action='store_true', help='Show a summary computed page by page in constant memory, without charting')
+    parser.add_argument('--quantiles', type=str, help='Comma-separated temperature quantiles for --stream-summary, e.g. 0.5,0.95')
     parser.add_argument('--utc', action='store_true', help='Use UTC dates instead of local timezone')
+    parser.add_argument('--no-cache', action='store_true', help='Read straight from DynamoDB, bypassing the local cache')
+    parser.add_argument('--refresh', action='store_true', help='Re-fetch cached days from DynamoDB and update the cache')
+    parser.add_argument('--decimate', choices=['lttb', 'minmax', 'none'], default='lttb', help='Downsample long series before plotting (default: lttb)')
+    parser.add_argument('--resolution', choices=['auto', 'raw', 'hour', 'day'], default='auto', help='Raw readings or hourly/daily rollups (default: auto from range)')
+    parser.add_argument('--follow', action='store_true', help='Keep running and add new readings to the charts as they are written (raw resolution)')
+    parser.add_argument('--interval', type=int, default=60, help='Seconds between --follow refreshes (default: 60)')
     
     args = parser.parse_args()
     
@@ -231,7 +682,9 @@ def main():
             end_date = start_date
         
         print(f"Charting data from {start_date} to {end_date} (UTC mode)")
-        df = fetch_data(start_date, end_date)
+        utc_start_dt = datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+        utc_end_dt = datetime.strptime(end_date, '%Y-%m-%d').replace(tzinfo=timezone.utc) + timedelta(days=1, seconds=-1)
+        fetch_tz = None
     else:
         # New timezone-aware mode
         if args.start:
@@ -253,29 +706,33 @@ def main():
         
         if local_start_date != local_end_date:
             # Handle date ranges
-            _, end_utc_end_date, _, _ = calculate_utc_date_range(local_end_date, local_tz_str)
-            utc_end_date = end_utc_end_date
+            _, utc_end_date, _, utc_end_dt = calculate_utc_date_range(local_end_date, local_tz_str)
         
         print(f"Querying UTC dates {utc_start_date} to {utc_end_date} to get local data")
         
-        # Fetch data with timezone info
-        df = fetch_data(utc_start_date, utc_end_date, local_tz_str)
-        
-        # Filter to only include data from the requested local date(s)
-        if not df.empty:
-            if local_start_date == local_end_date:
-                df = filter_data_by_local_date(df, local_start_date, local_tz_str)
-            else:
-                # Handle date ranges
-                start_date_obj = datetime.strptime(local_start_date, '%Y-%m-%d').date()
-                end_date_obj = datetime.strptime(local_end_date, '%Y-%m-%d').date()
-                df = df[(df['local_date'] >= start_date_obj) & (df['local_date'] <= end_date_obj)]
+        fetch_tz = local_tz_str
+    
+    if args.stream_summary:
+        # Summarize page by page without building a DataFrame or charting
+        quantiles = [float(q) for q in args.quantiles.split(',')] if args.quantiles else []
+        print_stream_summary(stream_summary(utc_start_dt, utc_end_dt, quantiles), quantiles)
+        return
+    
+    # The query window matches the requested day(s) exactly, so no rows
+    # outside them come back
+    # Following appends raw readings, so the charts start from raw readings too
+    resolution = 'raw' if args.follow else args.resolution
+    df = fetch_data(utc_start_dt, utc_end_dt, fetch_tz, use_cache=not args.no_cache, refresh=args.refresh, resolution=resolution)
     
     if args.summary:
         print_summary(df)
     
+    if args.follow:
+        follow_charts(df, utc_start_dt, utc_end_dt, fetch_tz, args.interval, args.save, args.decimate)
+        return
+
     if not df.empty:
-        create_charts(df, args.save)
+        create_charts(df, args.save, args.decimate)
     else:
         print("No data available for charting")
 
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Render many charts from a single fetch.
+
+Fetches the whole span once, splits it by local day, week or device and
+renders every chart in a process pool with the headless Agg backend. The
+PNGs and an index.html/index.json listing them are written to --output-dir.
+"""
+
+import argparse
+import html
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import matplotlib
+
+# Must be selected before chart_data imports pyplot
+matplotlib.use("Agg")
+
+from chart_data import calculate_utc_date_range, create_charts, fetch_data  # noqa: E402
+
+
+def split_frame(df, split):
+    """Yield (key, title, frame) groups of the fetched data"""
+    if split == "device":
+        for device, frame in df.groupby("device_name", sort=True):
+            yield device, device, frame
+    elif split == "week":
+        week_start = df["local_date"].map(lambda d: d - timedelta(days=d.weekday()))
+        for start, frame in df.groupby(week_start, sort=True):
+            yield f"week-{start}", f"Week of {start}", frame
+    else:
+        for day, frame in df.groupby("local_date", sort=True):
+            yield str(day), str(day), frame
+
+
+def render_group(job):
+    """Worker entry point: render one group to PNG"""
+    key, title, frame, path, decimate = job
+    create_charts(frame, path, decimate, title=f"Temperature and Humidity - {title}")
+    return {
+        "key": key,
+        "title": title,
+        "file": os.path.basename(path),
+        "readings": len(frame),
+    }
+
+
+def safe_filename(key):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in key) + ".png"
+
+
+def write_index(output_dir, entries, description):
+    with open(os.path.join(output_dir, "index.json"), "w") as f:
+        json.dump({"description": description, "charts": entries}, f, indent=2)
+
+    rows = "\n".join(
+        f'<li><a href="{html.escape(e["file"])}">{html.escape(e["title"])}</a>'
+        f' ({e["readings"]} readings)</li>'
+        for e in entries
+    )
+    with open(os.path.join(output_dir, "index.html"), "w") as f:
+        f.write(
+            f"<html><body><h1>{html.escape(description)}</h1>\n"
+            f"<ul>\n{rows}\n</ul></body></html>\n"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a batch of charts")
+    parser.add_argument(
+        "--start", type=str, required=True, help="Start date (YYYY-MM-DD)"
+    )
+    parser.add_argument(
+        "--end", type=str, help="End date (YYYY-MM-DD), defaults to start"
+    )
+    parser.add_argument(
+        "--timezone", type=str, default="America/New_York", help="Local timezone"
+    )
+    parser.add_argument(
+        "--split",
+        choices=["day", "week", "device"],
+        default="day",
+        help="One chart per",
+    )
+    parser.add_argument(
+        "--output-dir", type=str, default="reports", help="Where to write the charts"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="Rendering processes"
+    )
+    parser.add_argument(
+        "--decimate", choices=["lttb", "minmax", "none"], default="lttb"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Bypass the local day cache"
+    )
+    args = parser.parse_args()
+
+    end_date = args.end or args.start
+    _, _, utc_start_dt, _ = calculate_utc_date_range(args.start, args.timezone)
+    _, _, _, utc_end_dt = calculate_utc_date_range(end_date, args.timezone)
+
+    # One fetch for the whole span, always at full resolution
+    df = fetch_data(
+        utc_start_dt,
+        utc_end_dt,
+        args.timezone,
+        use_cache=not args.no_cache,
+        resolution="raw",
+    )
+    if df.empty:
+        print("No data available for the report")
+        return 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    jobs = [
+        (
+            key,
+            title,
+            frame,
+            os.path.join(args.output_dir, safe_filename(key)),
+            args.decimate,
+        )
+        for key, title, frame in split_frame(df, args.split)
+    ]
+
+    print(f"Rendering {len(jobs)} charts with {args.workers} workers...")
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        entries = list(executor.map(render_group, jobs))
+
+    description = (
+        f"{args.start} to {end_date} ({args.timezone}), " f"one chart per {args.split}"
+    )
+    write_index(args.output_dir, entries, description)
+    print(f"Wrote {len(entries)} charts and index.html to {args.output_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""Serve per-device series as compact, downsampled JSON for dashboards.
+
+    GET /series?start=...&end=...&points=500&resolution=auto&decimate=lttb
+
+start and end are ISO 8601 (UTC if no offset) or epoch seconds and default
+to the last 24 hours. The response looks like
+
+    {"resolution": "raw", "start": 1700000000, "end": 1700086400,
+     "series": [{"device": "Living Room", "t": [...],
+                 "temperature_celsius": [...], "humidity_percent": [...]}]}
+
+Completed UTC days are kept in memory (backed by the on-disk ReadingCache),
+and the current day is extended with only the readings written since the
+last request. Responses carry an ETag; a refresh whose data has not
+changed is answered with 304 before any JSON is built, and bodies are
+gzipped for clients that accept it.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import matplotlib
+
+# Must be selected before chart_data imports pyplot
+matplotlib.use("Agg")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from chart_data import (  # noqa: E402
+    DECIMATORS,
+    POLL_INTERVAL_SECONDS,
+    choose_resolution,
+    deadband_fill,
+    newest_keys,
+    readings_to_frame,
+    setup_aws,
+)
+from reading_cache import ReadingCache  # noqa: E402
+from src.storage import DynamoDBClient  # noqa: E402
+
+DEFAULT_WINDOW = timedelta(hours=24)
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+# The current day is re-read in full this often to pick up late writes
+LIVE_FULL_REFRESH = timedelta(minutes=15)
+# Rollup responses are rebuilt at most this often
+ROLLUP_TTL = timedelta(minutes=5)
+# Rendered bodies kept for other clients asking for the same thing
+BODY_CACHE_SIZE = 64
+METRICS = ("temperature_celsius", "humidity_percent")
+
+
+class SeriesStore:
+    """Readings by UTC day: completed days in memory, the live day kept fresh
+
+    _lock only guards the in-memory state and is never held during I/O.
+    Each day has its own lock around loading it, so concurrent requests for
+    the same day wait for one read while requests for other days go ahead.
+    """
+
+    def __init__(self, client, max_days=400):
+        self.client = client
+        self.disk_cache = ReadingCache(source=ReadingCache.source_for(client))
+        self.max_days = max_days
+        self._days = OrderedDict()
+        self._live = {}
+        self._rollups = {}
+        self._lock = threading.Lock()
+        self._day_locks = {}
+        self._disk_lock = threading.Lock()
+
+    def raw_frame(self, start_time, end_time):
+        """Return (frame, version) for a UTC window
+
+        version changes whenever the data in the window can have changed.
+        """
+        dates = self.client.date_strings(
+            start_time.strftime("%Y-%m-%d"), end_time.strftime("%Y-%m-%d")
+        )
+        frames = {}
+        version = []
+        missing = []
+        for date_str in dates:
+            if not ReadingCache.is_complete(date_str):
+                frames[date_str], live_version = self._live_day(date_str)
+                version.append(live_version)
+                continue
+            version.append(date_str)
+            frame = self._memory_day(date_str)
+            if frame is None:
+                missing.append(date_str)
+            else:
+                frames[date_str] = frame
+        if missing:
+            frames.update(self._load_days(missing))
+
+        frames = [frames[d] for d in dates if d in frames and not frames[d].empty]
+        if not frames:
+            return pd.DataFrame(), version
+        df = pd.concat(frames, ignore_index=True)
+        start_ts = int(start_time.timestamp())
+        end_ts = int(end_time.timestamp())
+        df = df[(df["timestamp"] >= start_ts) & (df["timestamp"] <= end_ts)]
+        return df.sort_values("timestamp", kind="stable"), version
+
+    def rollup_frame(self, resolution, start_time, end_time):
+        """Rollups for the window, reused for ROLLUP_TTL"""
+        key = (resolution, start_time, end_time)
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            cached = self._rollups.get(key)
+            if cached and now - cached[0] < ROLLUP_TTL:
+                return cached[1], [cached[0].isoformat()]
+
+        df = readings_to_frame(
+            self.client.get_rollups_time_window(resolution, start_time, end_time)
+        )
+        with self._lock:
+            # Drop expired entries so the dict stays small
+            self._rollups = {
+                k: v for k, v in self._rollups.items() if now - v[0] < ROLLUP_TTL
+            }
+            self._rollups[key] = (now, df)
+        return df, [now.isoformat()]
+
+    def _memory_day(self, date_str):
+        """A completed day's frame if it is held in memory, otherwise None"""
+        with self._lock:
+            frame = self._days.get(date_str)
+            if frame is not None:
+                self._days.move_to_end(date_str)
+            return frame
+
+    def _load_days(self, dates):
+        """Load completed days from the disk cache or DynamoDB as {date: frame}"""
+        locks = [self._day_lock(date_str) for date_str in dates]
+        for lock in locks:
+            lock.acquire()
+        try:
+            frames = {}
+            query = []
+            for date_str in dates:
+                # Another request may have loaded it while we waited
+                frame = self._memory_day(date_str)
+                if frame is None:
+                    with self._disk_lock:
+                        frame = self.disk_cache.get(date_str)
+                    if frame is not None:
+                        self._remember(date_str, frame)
+                if frame is None:
+                    query.append(date_str)
+                else:
+                    frames[date_str] = frame
+
+            for date_str, columns in self.client.load_columns_for_dates(query).items():
+                frame = frames[date_str] = pd.DataFrame(columns)
+                with self._disk_lock:
+                    self.disk_cache.put(date_str, frame)
+                self._remember(date_str, frame)
+            return frames
+        finally:
+            for lock in locks:
+                lock.release()
+
+    def _day_lock(self, date_str):
+        with self._lock:
+            return self._day_locks.setdefault(date_str, threading.Lock())
+
+    def _remember(self, date_str, frame):
+        with self._lock:
+            self._days[date_str] = frame
+            while len(self._days) > self.max_days:
+                self._days.popitem(last=False)
+
+    def _live_day(self, date_str):
+        """Bring an unfinished day up to date, reading only new readings
+
+        Like follow mode in chart_data, the read starts at the newest
+        timestamp held and drops the keys already held at it, so a reading
+        landing in an already-read second is not missed.
+        """
+        day_start = datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        day_end = day_start + timedelta(days=1) - timedelta(seconds=1)
+
+        with self._day_lock(date_str):
+            now = datetime.now(timezone.utc)
+            with self._lock:
+                live = self._live.get(date_str)
+
+            if live is None or now - live["loaded_at"] > LIVE_FULL_REFRESH:
+                frame = pd.DataFrame(
+                    self.client.load_columns_time_window(day_start, day_end)
+                )
+                cursor = (int(day_start.timestamp()), set())
+                if not frame.empty:
+                    cursor = newest_keys(frame["timestamp_device"])
+                live = {"frame": frame, "loaded_at": now, "cursor": cursor}
+            else:
+                last_timestamp, seen = live["cursor"]
+                new = pd.DataFrame(
+                    self.client.load_columns_after(last_timestamp, day_end, seen)
+                )
+                if not new.empty:
+                    live = dict(
+                        live,
+                        frame=pd.concat([live["frame"], new], ignore_index=True),
+                        cursor=newest_keys(
+                            new["timestamp_device"], last_timestamp, seen
+                        ),
+                    )
+
+            with self._lock:
+                self._live[date_str] = live
+                # Days that have become complete move to the completed-day cache
+                for stale in [d for d in self._live if ReadingCache.is_complete(d)]:
+                    del self._live[stale]
+
+        frame = live["frame"]
+        last = int(frame["timestamp"].max()) if not frame.empty else 0
+        return frame, f"{date_str}@{len(frame)}:{last}:{live['loaded_at']}"
+
+
+def downsample(df, points, method):
+    """Turn a frame into per-device {"t": [...], metric: [...]} series"""
+    series = []
+    for device, frame in df.groupby("device_name", sort=True):
+        frame = frame.sort_values("timestamp", kind="stable")
+        t = frame["timestamp"].to_numpy(dtype=np.int64)
+        metrics = [m for m in METRICS if m in frame and frame[m].notna().any()]
+
+        if metrics and method in DECIMATORS and len(t) > points:
+            # Pick points by the first metric; gaps are bridged for selection
+            y = frame[metrics[0]].ffill().bfill().to_numpy(dtype=np.float64)
+            keep = DECIMATORS[method](t, y, points)
+            frame = frame.iloc[keep]
+            t = t[keep]
+
+        entry = {"device": device, "t": t.tolist()}
+        for metric in metrics:
+            values = frame[metric].round(2)
+            entry[metric] = [None if v != v else v for v in values.tolist()]
+        series.append(entry)
+    return series
+
+
+def default_end():
+    """Now, rounded up to the next poll so a refresh keeps the same window"""
+    now = time.time()
+    return datetime.fromtimestamp(
+        now - now % POLL_INTERVAL_SECONDS + POLL_INTERVAL_SECONDS, timezone.utc
+    )
+
+
+def parse_time(value, default):
+    if not value:
+        return default
+    try:
+        return datetime.fromtimestamp(float(value), timezone.utc)
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            return parsed.replace(tzinfo=timezone.utc)
+        return parsed.astimezone(timezone.utc)
+
+
+class SeriesHandler(BaseHTTPRequestHandler):
+    store = None
+    bodies = OrderedDict()
+    bodies_lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != "/series":
+            return self.send_json(404, {"error": "Not found"})
+
+        try:
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            end_time = parse_time(params.get("end"), default_end())
+            start_time = parse_time(params.get("start"), end_time - DEFAULT_WINDOW)
+            points = min(int(params.get("points", DEFAULT_POINTS)), MAX_POINTS)
+            resolution = params.get("resolution", "auto")
+            method = params.get("decimate", "lttb")
+            if resolution == "auto":
+                resolution = choose_resolution(start_time, end_time)
+            if resolution not in ("raw", "hour", "day") or start_time > end_time:
+                raise ValueError("Invalid resolution or window")
+        except ValueError as e:
+            return self.send_json(400, {"error": str(e)})
+
+        if resolution == "raw":
+            df, version = self.store.raw_frame(start_time, end_time)
+        else:
+            df, version = self.store.rollup_frame(resolution, start_time, end_time)
+
+        etag = '"{}"'.format(
+            hashlib.sha1(
+                json.dumps(
+                    [
+                        url.path,
+                        int(start_time.timestamp()),
+                        int(end_time.timestamp()),
+                        points,
+                        method,
+                        resolution,
+                        version,
+                    ],
+                    default=str,
+                ).encode()
+            ).hexdigest()
+        )
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        with self.bodies_lock:
+            body = self.bodies.get(etag)
+        if body is None:
+            body = self.render(df, resolution, start_time, end_time, points, method)
+            with self.bodies_lock:
+                self.bodies[etag] = body
+                while len(self.bodies) > BODY_CACHE_SIZE:
+                    self.bodies.popitem(last=False)
+
+        self.send_body(200, body, etag)
+
+    def render(self, df, resolution, start_time, end_time, points, method):
+        """Build the JSON body and its gzipped form once per ETag"""
+        if (
+            resolution == "raw"
+            and os.getenv("DEADBAND_ENABLED", "false").lower() == "true"
+        ):
+            df = deadband_fill(self.store.client, df, start_time, end_time)
+
+        payload = {
+            "resolution": resolution,
+            "start": int(start_time.timestamp()),
+            "end": int(end_time.timestamp()),
+            "series": downsample(df, points, method) if not df.empty else [],
+        }
+        raw = json.dumps(payload, separators=(",", ":")).encode()
+        return {"raw": raw, "gzip": gzip.compress(raw, 6)}
+
+    def send_body(self, status, body, etag=None):
+        gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+        data = body["gzip"] if gzipped else body["raw"]
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Vary", "Accept-Encoding")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, status, payload):
+        raw = json.dumps(payload).encode()
+        self.send_body(status, {"raw": raw, "gzip": gzip.compress(raw)})
+
+    def log_message(self, format, *args):
+        print(f"{time.strftime('%H:%M:%S')} {self.address_string()} {format % args}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve downsampled series as JSON")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument(
+        "--max-days",
+        type=int,
+        default=400,
+        help="Completed days kept in memory (default: 400)",
+    )
+    args = parser.parse_args()
+
+    setup_aws()
+    SeriesHandler.store = SeriesStore(
+        DynamoDBClient(os.environ["DYNAMODB_TABLE"]), max_days=args.max_days
+    )
+
+    server = ThreadingHTTPServer((args.host, args.port), SeriesHandler)
+    print(f"Serving series on http://{args.host}:{args.port}/series")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
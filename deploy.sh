@@ -29,7 +29,9 @@ param_mapping = {
     'NEST_PROJECT_ID': 'NestProjectId',
     'OPENWEATHER_API_KEY': 'OpenWeatherApiKey',
     'WEATHER_LAT': 'WeatherLat',
-    'WEATHER_LON': 'WeatherLon'
+    'WEATHER_LON': 'WeatherLon',
+    'PUBSUB_VERIFICATION_TOKEN': 'PubSubVerificationToken',
+    'ROLLUPS_ENABLED': 'RollupsEnabled'
 }
 
 params = []
@@ -0,0 +1,105 @@
+"""On-disk cache of completed UTC days of readings for chart_data.py
+
+A UTC day that has fully ended never changes, so once it has been read from
+DynamoDB it is kept here as a compressed DataFrame (one file per day). Each
+table and endpoint gets its own subdirectory, so DynamoDB Local and AWS
+never share entries. The cache is bounded in size; the least recently used
+days are evicted first.
+"""
+
+import contextlib
+import hashlib
+import os
+import pickle
+import re
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+DEFAULT_CACHE_DIR = ".chart_cache"
+DEFAULT_MAX_MB = 256
+
+# A day only counts as complete once late writes for it have landed
+COMPLETE_DAY_GRACE = timedelta(hours=1)
+
+
+class ReadingCache:
+    def __init__(self, cache_dir=None, max_mb=None, source=None):
+        self.root_dir = cache_dir or os.getenv("CHART_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.cache_dir = self.root_dir
+        if source:
+            self.cache_dir = os.path.join(self.root_dir, self.source_dir(source))
+        if max_mb is None:
+            max_mb = float(os.getenv("CHART_CACHE_MAX_MB", DEFAULT_MAX_MB))
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def source_for(client):
+        """Identify the table a DynamoDBClient reads: its name and endpoint"""
+        endpoint = client.dynamodb.meta.client.meta.endpoint_url
+        return f"{client.table_name}@{endpoint}"
+
+    @staticmethod
+    def source_dir(source):
+        """A readable, collision-free directory name for a source"""
+        table = re.sub(r"[^A-Za-z0-9_.-]", "_", source.split("@")[0])
+        return f"{table}-{hashlib.sha1(source.encode()).hexdigest()[:10]}"
+
+    @staticmethod
+    def is_complete(date_str, now=None):
+        """True if the UTC day has ended and can be cached permanently"""
+        now = now or datetime.now(timezone.utc)
+        day_end = datetime.strptime(date_str, "%Y-%m-%d").replace(
+            tzinfo=timezone.utc
+        ) + timedelta(days=1)
+        return now >= day_end + COMPLETE_DAY_GRACE
+
+    def get(self, date_str):
+        """Return the cached DataFrame for a UTC day, or None on a miss"""
+        path = self._path(date_str)
+        try:
+            df = pd.read_pickle(path)
+        except FileNotFoundError:
+            return None
+        except (EOFError, ValueError, OSError, zlib.error, pickle.UnpicklingError) as e:
+            # Truncated or corrupt (e.g. an interrupted write), read it again
+            print(f"Ignoring unreadable cache file {path}: {e}")
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            return None
+        # Reads count as use for LRU eviction
+        os.utime(path)
+        return df
+
+    def put(self, date_str, df):
+        path = self._path(date_str)
+        tmp_path = f"{path}.tmp"
+        df.to_pickle(tmp_path, compression="gzip")
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used days until the cache fits max_bytes
+
+        The limit covers every source under the cache directory together.
+        """
+        entries = []
+        for directory, _, names in os.walk(self.root_dir):
+            for name in names:
+                if not name.endswith(".pkl.gz"):
+                    continue
+                path = os.path.join(directory, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def _path(self, date_str):
+        return os.path.join(self.cache_dir, f"{date_str}.pkl.gz")
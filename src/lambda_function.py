@@ -1,95 +1,1173 @@
+import base64
+import hashlib
 import json
 import os
+import random
+import threading
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-import boto3
-import requests
 
+# Lambda loads this file as a top-level module next to storage.py and
+# metrics.py; the local scripts import it as src.lambda_function
+try:
+    from .metrics import instrumented, timed
+    from .storage import DynamoDBClient, get_dynamodb_resource
+except ImportError:
+    from metrics import instrumented, timed
+    from storage import DynamoDBClient, get_dynamodb_resource
 
+# boto3 and requests are imported on first use (see create_session and
+# storage.get_dynamodb_resource) to keep them out of the module import on
+# cold start
+
+# Upper bound on simultaneous outbound API calls per invocation
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Readings not fetched within this many seconds are skipped, so one slow
+# device cannot hold up saving the rest of the batch
+DEFAULT_FETCH_TIMEOUT = 20
+
+# Tenants polled at once when TENANTS_FILE lists several homes
+DEFAULT_TENANT_CONCURRENCY = 4
+
+# Clients kept alive between warm Lambda invocations, see get_clients()
+_client_cache = {}
+
+# OAuth access tokens shared by every TokenCache in this container
+_token_store = {}
+
+# Current weather by rounded location, shared by every WeatherCache in this
+# container, plus one lock per location so concurrent misses make one call
+_weather_store = {}
+_weather_locks = {}
+_weather_locks_guard = threading.Lock()
+
+# Seconds a cached weather observation stays valid, and the decimal places
+# lat/lon are rounded to (2 is about 1 km)
+DEFAULT_WEATHER_CACHE_TTL = 600
+DEFAULT_WEATHER_CACHE_PRECISION = 2
+
+# Refresh access tokens this many seconds before they expire
+DEFAULT_TOKEN_REFRESH_MARGIN = 300
+
+# Outbound API calls per second (and burst) allowed per host, see
+# RequestScheduler
+DEFAULT_REQUEST_RATE = 10
+DEFAULT_REQUEST_BURST = 10
+DEFAULT_REQUEST_RETRIES = 4
+# Exponential backoff bounds in seconds; Retry-After is honored up to the cap
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8
+RETRY_AFTER_CAP = 60
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Seconds to wait for a single HTTP response (REQUEST_TIMEOUT)
+DEFAULT_REQUEST_TIMEOUT = 10
+# Stop making calls this long before the Lambda times out so readings
+# already fetched can still be saved
+DEADLINE_MARGIN = 3
+
+# Shared by every API client in this container, see get_request_scheduler()
+_request_scheduler = None
+
+# Push ingestion (pubsub_handler): concurrent pushes in one process are
+# written together, up to PUBSUB_BATCH_SIZE readings, waiting at most
+# PUBSUB_BATCH_WAIT_MS for more to arrive. A Lambda container serves one push
+# at a time, so there every push is its own write.
+DEFAULT_PUBSUB_BATCH_SIZE = 25
+DEFAULT_PUBSUB_BATCH_WAIT_MS = 0
+_ingest_batcher = None
+
+# Device display names as last stored in the "device_names" state item,
+# written by the poller and read by pubsub_handler
+_device_names = {}
+_device_names_lock = threading.Lock()
+
+# Deadband mode (DEADBAND_ENABLED): a polled reading is only written when a
+# metric moved by at least its threshold since the device's last written
+# reading, or when the heartbeat interval has passed
+DEADBAND_THRESHOLDS = {
+    "temperature_celsius": ("DEADBAND_TEMPERATURE", 0.2),
+    "humidity_percent": ("DEADBAND_HUMIDITY", 1),
+}
+DEFAULT_DEADBAND_HEARTBEAT_MINUTES = 60
+# Last written reading per device_id, None until loaded from the state item
+_deadband_state = {"devices": None}
+_deadband_lock = threading.Lock()
+
+
+@instrumented
 def lambda_handler(event, context):
+    get_request_scheduler().set_deadline(context)
+
+    if os.environ.get("TENANTS_FILE"):
+        return poll_tenants(os.environ["TENANTS_FILE"])
+
     try:
-        nest_client = NestClient(
-            client_id=os.environ["NEST_CLIENT_ID"],
-            client_secret=os.environ["NEST_CLIENT_SECRET"],
-            refresh_token=os.environ["NEST_REFRESH_TOKEN"],
+        with timed("get_clients"):
+            nest_client, weather_client, dynamodb_client = get_clients()
+
+        with timed("get_devices"):
+            devices = nest_client.get_devices()
+        remember_device_names(nest_client, dynamodb_client, devices)
+
+        current_time = datetime.utcnow()
+        with timed("fetch_readings"):
+            sensor_readings = fetch_readings(
+                nest_client,
+                weather_client,
+                devices,
+                current_time,
+                max_workers=int(
+                    os.environ.get("MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)
+                ),
+                snapshot=os.environ.get("NEST_SNAPSHOT_MODE", "true").lower() == "true",
+            )
+
+        written = []
+        if sensor_readings:
+            with timed("save_readings"):
+                written = save_polled_readings(dynamodb_client, sensor_readings)
+            print(f"Saved {len(written)} of {len(sensor_readings)} sensor readings")
+
+        return {
+            "statusCode": 200,
+            "body": json.dumps(
+                {
+                    "message": f"Successfully processed {len(sensor_readings)} readings",
+                    "written": len(written),
+                    "readings": sensor_readings,
+                }
+            ),
+        }
+
+    except Exception as e:
+        print(f"Error in lambda_handler: {str(e)}")
+        return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
+
+
+@instrumented
+def compaction_handler(event, context):
+    """Pack a completed UTC day into per-device blocks (default: yesterday)"""
+    try:
+        date_str = (event or {}).get("date") or (
+            datetime.utcnow() - timedelta(days=1)
+        ).strftime("%Y-%m-%d")
+
+        dynamodb_client = DynamoDBClient(
+            os.environ["DYNAMODB_TABLE"], dynamodb=get_dynamodb_resource()
         )
+        packed = dynamodb_client.compact_day(date_str)
+        print(f"Compacted {packed} readings for {date_str}")
+
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"date": date_str, "compacted": packed}),
+        }
 
-        weather_client = OpenWeatherClient(os.environ["OPENWEATHER_API_KEY"])
-        dynamodb_client = DynamoDBClient(os.environ["DYNAMODB_TABLE"])
+    except Exception as e:
+        print(f"Error in compaction_handler: {str(e)}")
+        return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
 
-        devices = nest_client.get_devices()
-        sensor_readings = []
 
-        current_time = datetime.utcnow()
-        timestamp = int(current_time.timestamp())
-        date_str = current_time.strftime("%Y-%m-%d")
+def pubsub_handler(event, context):
+    """Ingest Device Access events delivered by a Pub/Sub push subscription
 
-        for device in devices:
-            reading = nest_client.get_sensor_data(device["name"])
-            if reading:
-                device_short_id = device["name"].split("/")[
-                    -1
-                ]  # Get just the device ID part
-
-                # Try to get a human-readable name from multiple sources
-                device_name = nest_client.get_device_display_name(device)
-
-                reading_data = {
-                    "date": date_str,
-                    "timestamp_device": f"{timestamp}#{device_short_id}",
-                    "device_id": device["name"],
-                    "device_name": device_name,
-                    "timestamp": timestamp,
-                    "readable_time": current_time.isoformat(),
+    Temperature and humidity trait updates become readings in the same
+    schema the poller writes; other events are acknowledged and ignored.
+    Malformed messages are acknowledged too, since redelivery cannot fix
+    them, while a failed write returns 500 so Pub/Sub retries. The push
+    endpoint must be called with ?token=<PUBSUB_VERIFICATION_TOKEN>; every
+    request is rejected while the token is not configured.
+    """
+    import hmac
+
+    token = os.environ.get("PUBSUB_VERIFICATION_TOKEN")
+    if not token:
+        print("PUBSUB_VERIFICATION_TOKEN is not set, rejecting push")
+        return {
+            "statusCode": 403,
+            "body": json.dumps({"error": "Push endpoint is not configured"}),
+        }
+    supplied = (event.get("queryStringParameters") or {}).get("token") or ""
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        return {"statusCode": 403, "body": json.dumps({"error": "Invalid token"})}
+
+    try:
+        body = event.get("body") or "{}"
+        if event.get("isBase64Encoded"):
+            body = base64.b64decode(body)
+        readings = parse_push_message(json.loads(body))
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Ignoring malformed push message: {str(e)}")
+        return {"statusCode": 204, "body": ""}
+
+    try:
+        if readings:
+            get_ingest_batcher().submit(readings)
+        return {"statusCode": 200, "body": json.dumps({"readings": len(readings)})}
+
+    except Exception as e:
+        print(f"Error in pubsub_handler: {str(e)}")
+        return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
+
+
+def parse_push_message(message):
+    """Map one Pub/Sub push message to a list of readings (usually 0 or 1)"""
+    event = json.loads(base64.b64decode(message["message"]["data"]))
+    update = event.get("resourceUpdate") or {}
+    reading = NestClient.extract_sensor_data(update.get("traits", {}))
+    if not reading:
+        return []
+
+    # RFC 3339 with optional fractional seconds; readings are per second
+    event_time = event.get("timestamp") or message["message"]["publishTime"]
+    current_time = datetime.strptime(event_time[:19], "%Y-%m-%dT%H:%M:%S")
+
+    device_id = update["name"]
+    timestamp = int(current_time.replace(tzinfo=timezone.utc).timestamp())
+    device_short_id = device_id.split("/")[-1]
+
+    reading_data = {
+        "date": current_time.strftime("%Y-%m-%d"),
+        "timestamp_device": f"{timestamp}#{device_short_id}",
+        "device_id": device_id,
+        "device_name": lookup_device_name(device_id),
+        "timestamp": timestamp,
+        "readable_time": current_time.isoformat(),
+    }
+    tenant_id = lookup_tenant_id(device_id)
+    if tenant_id:
+        reading_data["tenant_id"] = tenant_id
+    reading_data.update(reading)
+    return [reading_data]
+
+
+def remember_device_names(nest_client, dynamodb_client, devices):
+    """Store device display names for pubsub_handler when they change"""
+    names = {
+        device["name"]: nest_client.get_device_display_name(device)
+        for device in devices
+    }
+    with _device_names_lock:
+        if all(_device_names.get(name) == value for name, value in names.items()):
+            return
+        _device_names.update(names)
+        try:
+            dynamodb_client.put_state("device_names", {"names": dict(_device_names)})
+        except Exception as e:
+            print(f"Error saving device names: {str(e)}")
+
+
+def lookup_device_name(device_id):
+    """Display name saved by the poller, falling back to the short device id"""
+    if device_id not in _device_names:
+        with _device_names_lock:
+            try:
+                item = get_ingest_batcher().dynamodb_client.get_state("device_names")
+            except Exception as e:
+                print(f"Error loading device names: {str(e)}")
+                item = None
+            if item:
+                _device_names.update(item["names"])
+    return _device_names.get(device_id) or device_id.split("/")[-1]
+
+
+def lookup_tenant_id(device_id):
+    """Tenant whose Nest project owns the device, when TENANTS_FILE is set"""
+    if not os.environ.get("TENANTS_FILE"):
+        return None
+    project_id = device_id.split("/")[1]
+    for tenant in load_tenants(os.environ["TENANTS_FILE"]):
+        if tenant["nest_project_id"] == project_id:
+            return tenant["id"]
+    return None
+
+
+def get_ingest_batcher():
+    """The ReadingBatcher pubsub_handler writes through, one per container"""
+    global _ingest_batcher
+    if _ingest_batcher is None:
+        _ingest_batcher = ReadingBatcher(
+            DynamoDBClient(
+                os.environ["DYNAMODB_TABLE"], dynamodb=get_dynamodb_resource()
+            )
+        )
+    return _ingest_batcher
+
+
+class ReadingBatcher:
+    """Collect readings from concurrent callers into shared merge_readings calls
+
+    submit() returns once the caller's readings are written. The first
+    caller into an empty batch waits up to max_wait_ms for max_size
+    readings to gather, then writes the batch on behalf of everyone in it;
+    a write error is raised in every caller. Only callers in the same
+    process share a batch (src/local_pubsub.py's threaded server); readings
+    are merged into what is stored, so separate temperature and humidity
+    events in one second end up in one item either way.
+    """
+
+    def __init__(self, dynamodb_client, max_size=None, max_wait_ms=None):
+        self.dynamodb_client = dynamodb_client
+        self.max_size = int(
+            max_size or os.environ.get("PUBSUB_BATCH_SIZE", DEFAULT_PUBSUB_BATCH_SIZE)
+        )
+        if max_wait_ms is None:
+            max_wait_ms = float(
+                os.environ.get("PUBSUB_BATCH_WAIT_MS", DEFAULT_PUBSUB_BATCH_WAIT_MS)
+            )
+        self.max_wait = max_wait_ms / 1000
+        self._batch = None
+        self._condition = threading.Condition()
+
+    def submit(self, readings):
+        with self._condition:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = {
+                    "readings": {},
+                    "error": None,
+                    "done": threading.Event(),
                 }
-                reading_data.update(reading)
-                sensor_readings.append(reading_data)
+            for reading in readings:
+                key = (reading["date"], reading["timestamp_device"])
+                batch["readings"].setdefault(key, {}).update(reading)
+            if len(batch["readings"]) >= self.max_size:
+                self._condition.notify_all()
 
-        # Get outdoor weather data
-        outdoor_weather = weather_client.get_weather_data()
-        if outdoor_weather:
-            outdoor_reading = {
-                "date": date_str,
-                "timestamp_device": f"{timestamp}#outdoor_weather",
-                "device_id": "outdoor_weather",
-                "device_name": "Boston, MA (OpenWeather)",
-                "timestamp": timestamp,
-                "readable_time": current_time.isoformat(),
-            }
-            outdoor_reading.update(outdoor_weather)
-            sensor_readings.append(outdoor_reading)
+            if leader:
+                self._condition.wait_for(
+                    lambda: len(batch["readings"]) >= self.max_size,
+                    timeout=self.max_wait,
+                )
+                # Later callers start a new batch
+                self._batch = None
 
+        if leader:
+            try:
+                self.dynamodb_client.merge_readings(
+                    sorted(batch["readings"].values(), key=lambda r: r["timestamp"])
+                )
+            except Exception as e:
+                batch["error"] = e
+            batch["done"].set()
+        else:
+            batch["done"].wait()
+
+        if batch["error"] is not None:
+            raise batch["error"]
+
+
+def poll_tenants(tenants_file):
+    """Poll every tenant (home) in one invocation and save all readings together
+
+    Tenants are read from tenants_file (see load_tenants) and polled
+    concurrently, TENANT_CONCURRENCY at a time, over
+    shared HTTP sessions. A tenant that fails is logged and skipped; the
+    readings of all other tenants go through one save_readings call so they
+    share batch_writer flushes.
+    """
+    try:
+        tenants = load_tenants(tenants_file)
+        with timed("get_clients"):
+            tenant_clients, dynamodb_client = get_tenant_clients(tenants)
+        current_time = datetime.utcnow()
+        max_workers = int(os.environ.get("MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        snapshot = os.environ.get("NEST_SNAPSHOT_MODE", "true").lower() == "true"
+
+        def poll_tenant(tenant, nest_client, weather_client):
+            with timed("get_devices"):
+                devices = nest_client.get_devices()
+            remember_device_names(nest_client, dynamodb_client, devices)
+            return fetch_readings(
+                nest_client,
+                weather_client,
+                devices,
+                current_time,
+                max_workers=max_workers,
+                snapshot=snapshot,
+                tenant=tenant,
+            )
+
+        tenant_concurrency = int(
+            os.environ.get("TENANT_CONCURRENCY", DEFAULT_TENANT_CONCURRENCY)
+        )
+        futures = {}
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(tenant_concurrency, len(tenant_clients)))
+        ) as executor:
+            for tenant, nest_client, weather_client in tenant_clients:
+                future = executor.submit(
+                    poll_tenant, tenant, nest_client, weather_client
+                )
+                futures[future] = tenant["id"]
+
+            results = {}
+            summary = {}
+            for future in as_completed(futures):
+                tenant_id = futures[future]
+                try:
+                    results[future] = future.result()
+                    summary[tenant_id] = len(results[future])
+                except Exception as e:
+                    print(f"Error polling tenant {tenant_id}: {str(e)}")
+                    summary[tenant_id] = f"error: {str(e)}"
+
+        # Keep tenant order from the tenants file
+        sensor_readings = [
+            reading for f in futures if f in results for reading in results[f]
+        ]
+        written = []
         if sensor_readings:
-            dynamodb_client.save_readings(sensor_readings)
-            print(f"Saved {len(sensor_readings)} sensor readings")
+            with timed("save_readings"):
+                written = save_polled_readings(dynamodb_client, sensor_readings)
+            print(
+                f"Saved {len(written)} of {len(sensor_readings)} sensor readings "
+                f"for {len(results)} tenants"
+            )
 
         return {
             "statusCode": 200,
             "body": json.dumps(
                 {
                     "message": f"Successfully processed {len(sensor_readings)} readings",
+                    "written": len(written),
+                    "tenants": summary,
                     "readings": sensor_readings,
                 }
             ),
         }
 
     except Exception as e:
-        print(f"Error in lambda_handler: {str(e)}")
+        print(f"Error in poll_tenants: {str(e)}")
         return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
 
 
+def load_tenants(path):
+    """Read the list of tenants (homes) to poll from a JSON file
+
+    Each entry needs id, nest_client_id, nest_client_secret,
+    nest_refresh_token and nest_project_id. weather_lat, weather_lon,
+    weather_name and openweather_api_key are optional; the API key falls
+    back to OPENWEATHER_API_KEY.
+    """
+    with open(path) as f:
+        tenants = json.load(f)
+
+    ids = [tenant["id"] for tenant in tenants]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Tenant ids in TENANTS_FILE must be unique")
+    return tenants
+
+
+def get_tenant_clients(tenants):
+    """Return ([(tenant, nest, weather), ...], dynamodb) for poll_tenants
+
+    All tenants share the DynamoDB client, the token cache and one pooled
+    HTTP session per API, so adding a tenant adds no new connections. Like
+    get_clients, everything is reused across warm invocations unless
+    CLIENT_REUSE=false.
+    """
+    reuse = os.environ.get("CLIENT_REUSE", "true").lower() == "true"
+    shared = _client_cache.get("tenant_shared")
+    if not reuse or shared is None or shared[0] != os.environ["DYNAMODB_TABLE"]:
+        pool_size = int(
+            os.environ.get("MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)
+        ) * int(os.environ.get("TENANT_CONCURRENCY", DEFAULT_TENANT_CONCURRENCY))
+        dynamodb_client = DynamoDBClient(
+            os.environ["DYNAMODB_TABLE"], dynamodb=get_dynamodb_resource()
+        )
+        token_cache = TokenCache(
+            path=os.environ.get("TOKEN_CACHE_FILE"),
+            dynamodb_client=(
+                dynamodb_client
+                if os.environ.get("TOKEN_CACHE_DYNAMODB", "false").lower() == "true"
+                else None
+            ),
+        )
+        shared = (
+            os.environ["DYNAMODB_TABLE"],
+            dynamodb_client,
+            token_cache,
+            create_weather_cache(dynamodb_client),
+            create_session(pool_size),
+            create_session(pool_size),
+        )
+        _client_cache["tenant_shared"] = shared
+        _client_cache["tenants"] = {}
+    _, dynamodb_client, token_cache, weather_cache, nest_session, weather_session = (
+        shared
+    )
+
+    tenant_clients = []
+    for tenant in tenants:
+        config = json.dumps(tenant, sort_keys=True)
+        clients = _client_cache["tenants"].get(config)
+        if clients is None:
+            clients = (
+                NestClient(
+                    client_id=tenant["nest_client_id"],
+                    client_secret=tenant["nest_client_secret"],
+                    refresh_token=tenant["nest_refresh_token"],
+                    session=nest_session,
+                    token_cache=token_cache,
+                    project_id=tenant["nest_project_id"],
+                ),
+                OpenWeatherClient(
+                    tenant.get("openweather_api_key")
+                    or os.environ["OPENWEATHER_API_KEY"],
+                    lat=tenant.get("weather_lat"),
+                    lon=tenant.get("weather_lon"),
+                    session=weather_session,
+                    cache=weather_cache,
+                ),
+            )
+            _client_cache["tenants"][config] = clients
+        tenant_clients.append((tenant, *clients))
+
+    if not reuse:
+        _client_cache.clear()
+    return tenant_clients, dynamodb_client
+
+
+def get_clients():
+    """Return (nest, weather, dynamodb) clients for this invocation.
+
+    The clients, their pooled HTTP sessions and the boto3 resource are built
+    once per container and reused by warm invocations. Set CLIENT_REUSE=false
+    to build fresh clients every time.
+    """
+    config = (
+        os.environ["NEST_CLIENT_ID"],
+        os.environ["NEST_CLIENT_SECRET"],
+        os.environ["NEST_REFRESH_TOKEN"],
+        os.environ["OPENWEATHER_API_KEY"],
+        os.environ["DYNAMODB_TABLE"],
+    )
+    reuse = os.environ.get("CLIENT_REUSE", "true").lower() == "true"
+
+    if reuse and _client_cache.get("config") == config:
+        return _client_cache["clients"]
+
+    pool_size = int(os.environ.get("MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+    dynamodb_client = DynamoDBClient(config[4], dynamodb=get_dynamodb_resource())
+    token_cache = TokenCache(
+        path=os.environ.get("TOKEN_CACHE_FILE"),
+        dynamodb_client=(
+            dynamodb_client
+            if os.environ.get("TOKEN_CACHE_DYNAMODB", "false").lower() == "true"
+            else None
+        ),
+    )
+    weather_cache = create_weather_cache(dynamodb_client)
+    nest_client = NestClient(
+        client_id=config[0],
+        client_secret=config[1],
+        refresh_token=config[2],
+        session=create_session(pool_size),
+        token_cache=token_cache,
+    )
+    weather_client = OpenWeatherClient(
+        config[3], session=create_session(pool_size), cache=weather_cache
+    )
+
+    if reuse:
+        _client_cache["config"] = config
+        _client_cache["clients"] = (nest_client, weather_client, dynamodb_client)
+    else:
+        _client_cache.clear()
+
+    return nest_client, weather_client, dynamodb_client
+
+
+def create_session(pool_size=DEFAULT_MAX_CONCURRENCY):
+    """Create a keep-alive requests session sized for concurrent fetches"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, pool_size))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def create_weather_cache(dynamodb_client):
+    """WeatherCache for the poller, backed by DynamoDB if WEATHER_CACHE_DYNAMODB"""
+    return WeatherCache(
+        dynamodb_client=(
+            dynamodb_client
+            if os.environ.get("WEATHER_CACHE_DYNAMODB", "false").lower() == "true"
+            else None
+        )
+    )
+
+
+def get_request_scheduler():
+    """The RequestScheduler shared by NestClient and OpenWeatherClient"""
+    global _request_scheduler
+    if _request_scheduler is None:
+        _request_scheduler = RequestScheduler()
+    return _request_scheduler
+
+
+class RequestScheduler:
+    """Rate limit and retry outbound HTTP calls for every API client
+
+    Each host gets a token bucket (REQUEST_RATE calls per second, bursts of
+    REQUEST_BURST) shared by all threads. Throttling and server errors are
+    retried up to REQUEST_RETRIES times with full-jitter exponential backoff,
+    or after the server's Retry-After, during which the whole host is
+    paused. Once set_deadline has been given the Lambda context, no call or
+    wait runs past the invocation's remaining time.
+    """
+
+    def __init__(self, rate=None, burst=None, max_retries=None):
+        self.rate = float(rate or os.environ.get("REQUEST_RATE", DEFAULT_REQUEST_RATE))
+        self.burst = float(
+            burst or os.environ.get("REQUEST_BURST", DEFAULT_REQUEST_BURST)
+        )
+        if max_retries is None:
+            max_retries = int(
+                os.environ.get("REQUEST_RETRIES", DEFAULT_REQUEST_RETRIES)
+            )
+        self.max_retries = max_retries
+        self.timeout = float(os.environ.get("REQUEST_TIMEOUT", DEFAULT_REQUEST_TIMEOUT))
+        self.deadline = None
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def set_deadline(self, context):
+        """Bound every call to the remaining time of a Lambda invocation"""
+        if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+            self.deadline = None
+            return
+        remaining = context.get_remaining_time_in_millis() / 1000
+        self.deadline = time.monotonic() + remaining - DEADLINE_MARGIN
+
+    def request(self, session, method, url, **kwargs):
+        """session.request with rate limiting, retries and the deadline
+
+        Returns the last response, so callers still raise_for_status().
+        """
+        import requests
+        from urllib.parse import urlsplit
+
+        host = urlsplit(url).netloc
+        bucket = self._bucket(host)
+        attempt = 0
+        while True:
+            with timed("http.rate_limit_wait"):
+                bucket.acquire(self.deadline)
+            timeout = self.timeout
+            if self.deadline is not None:
+                timeout = min(timeout, max(0.1, self.deadline - time.monotonic()))
+
+            try:
+                with timed(f"http.{host}"):
+                    response = session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if (
+                    response.status_code not in RETRY_STATUSES
+                    or attempt >= self.max_retries
+                ):
+                    return response
+                retry_after = self._retry_after(response)
+                if retry_after is None:
+                    delay = self._backoff(attempt)
+                else:
+                    delay = retry_after
+                    bucket.pause(delay)
+
+            if self.deadline is not None and time.monotonic() + delay > self.deadline:
+                raise TimeoutError(f"Deadline reached retrying {method} {url}")
+            print(f"Retrying {method} {url} in {delay:.1f}s (attempt {attempt + 1})")
+            with timed("http.backoff_wait"):
+                time.sleep(delay)
+            attempt += 1
+
+    def _bucket(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = _TokenBucket(self.rate, self.burst)
+            return self._buckets[host]
+
+    @staticmethod
+    def _backoff(attempt):
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
+
+    @staticmethod
+    def _retry_after(response):
+        """Seconds to wait from a Retry-After header, or None"""
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            from email.utils import parsedate_to_datetime
+
+            try:
+                seconds = (
+                    parsedate_to_datetime(value) - datetime.now(timezone.utc)
+                ).total_seconds()
+            except (TypeError, ValueError):
+                return None
+        return min(max(seconds, 0), RETRY_AFTER_CAP)
+
+
+class _TokenBucket:
+    """Thread-safe token bucket that can be paused after a 429"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+
+            if deadline is not None and now + wait > deadline:
+                raise TimeoutError("Deadline reached waiting for a request slot")
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def save_polled_readings(dynamodb_client, readings):
+    """Save polled readings and return the ones written
+
+    With DEADBAND_ENABLED=true, readings that barely changed since the
+    device's last write are skipped (see DeadbandFilter); readers step-fill
+    the gaps. Skipped readings still count towards the rollups, so hourly
+    and daily means match the step-filled raw series.
+    """
+    if os.environ.get("DEADBAND_ENABLED", "false").lower() != "true":
+        dynamodb_client.save_readings(readings)
+        return readings
+
+    deadband = DeadbandFilter(dynamodb_client)
+    changed = deadband.filter(readings)
+    if changed:
+        dynamodb_client.save_readings(changed)
+        deadband.commit(changed)
+    changed_keys = {reading["timestamp_device"] for reading in changed}
+    dynamodb_client.add_to_rollups(
+        [r for r in readings if r["timestamp_device"] not in changed_keys]
+    )
+    return changed
+
+
+class DeadbandFilter:
+    """Skip polled readings whose metrics stayed within a threshold
+
+    The last written reading of each device is kept in memory across warm
+    invocations and in a "deadband" state item for cold starts. A device is
+    written anyway once DEADBAND_HEARTBEAT_MINUTES have passed since its
+    last write, so gaps stay bounded and outages remain visible. Thresholds
+    are compared with the last written value, not the last polled one, so
+    slow drifts still get recorded.
+    """
+
+    def __init__(self, dynamodb_client, thresholds=None, heartbeat_minutes=None):
+        self.dynamodb_client = dynamodb_client
+        if thresholds is None:
+            thresholds = {
+                metric: float(os.environ.get(name, default))
+                for metric, (name, default) in DEADBAND_THRESHOLDS.items()
+            }
+        if heartbeat_minutes is None:
+            heartbeat_minutes = float(
+                os.environ.get(
+                    "DEADBAND_HEARTBEAT_MINUTES", DEFAULT_DEADBAND_HEARTBEAT_MINUTES
+                )
+            )
+        self.thresholds = thresholds
+        self.heartbeat = heartbeat_minutes * 60
+
+    def filter(self, readings):
+        """Return the readings that need to be written"""
+        last_written = self._devices()
+        return [
+            reading
+            for reading in readings
+            if self._changed(last_written.get(reading["device_id"]), reading)
+        ]
+
+    def commit(self, readings):
+        """Record readings as written, once save_readings has succeeded"""
+        with _deadband_lock:
+            devices = _deadband_state["devices"]
+            for reading in readings:
+                entry = {"timestamp": int(reading["timestamp"])}
+                for metric in self.thresholds:
+                    if reading.get(metric) is not None:
+                        entry[metric] = float(reading[metric])
+                devices[reading["device_id"]] = entry
+            try:
+                self.dynamodb_client.put_state("deadband", {"devices": devices})
+            except Exception as e:
+                # The in-memory copy still applies to warm invocations
+                print(f"Error saving deadband state: {str(e)}")
+
+    def _changed(self, last, reading):
+        if last is None:
+            return True
+        if int(reading["timestamp"]) - int(last["timestamp"]) >= self.heartbeat:
+            return True
+        for metric, threshold in self.thresholds.items():
+            value = reading.get(metric)
+            previous = last.get(metric)
+            if (value is None) != (previous is None):
+                return True
+            if value is None:
+                continue
+            # Rounded so a 0.2 step is not lost to float error
+            if round(abs(float(value) - float(previous)), 6) >= threshold:
+                return True
+        return False
+
+    def _devices(self):
+        with _deadband_lock:
+            if _deadband_state["devices"] is None:
+                try:
+                    item = self.dynamodb_client.get_state("deadband")
+                except Exception as e:
+                    print(f"Error loading deadband state: {str(e)}")
+                    item = None
+                _deadband_state["devices"] = dict(item["devices"]) if item else {}
+            return dict(_deadband_state["devices"])
+
+
+def fetch_readings(
+    nest_client,
+    weather_client,
+    devices,
+    current_time,
+    max_workers,
+    snapshot=True,
+    tenant=None,
+    timeout=None,
+):
+    """Fetch every device reading and the outdoor weather concurrently.
+
+    Each fetch is isolated: a device or weather call that raises, or has
+    not finished after timeout seconds (FETCH_TIMEOUT), is logged and
+    skipped so the rest of the batch is still saved. In snapshot mode
+    device readings come from the traits already returned by get_devices.
+    With a tenant, every reading is tagged with its tenant_id.
+    """
+    if timeout is None:
+        timeout = float(os.environ.get("FETCH_TIMEOUT", DEFAULT_FETCH_TIMEOUT))
+
+    futures = {}
+    results = {}
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        for device in devices:
+            future = executor.submit(
+                build_device_reading, nest_client, device, current_time, snapshot
+            )
+            futures[future] = device["name"]
+
+        weather_future = executor.submit(
+            build_outdoor_reading, weather_client, current_time, tenant
+        )
+        futures[weather_future] = "outdoor_weather"
+
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                try:
+                    results[future] = future.result()
+                except Exception as e:
+                    print(f"Error fetching {futures[future]}: {str(e)}")
+        except FuturesTimeoutError:
+            for future, name in futures.items():
+                if not future.done():
+                    print(f"Error fetching {name}: no response after {timeout}s")
+    finally:
+        # Don't wait for stragglers; their results are dropped
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # Keep the original ordering: devices first, then outdoor weather
+    readings = [results[f] for f in futures if results.get(f)]
+    if tenant:
+        for reading in readings:
+            reading["tenant_id"] = tenant["id"]
+    return readings
+
+
+def build_device_reading(nest_client, device, current_time, snapshot=True):
+    if snapshot and "traits" in device:
+        # Devices without temperature or humidity traits (cameras,
+        # doorbells) give an empty reading and are skipped without a GET
+        reading = nest_client.extract_sensor_data(device["traits"])
+    else:
+        # Traits missing from the device listing, fall back to a per-device GET
+        with timed("get_sensor_data"):
+            reading = nest_client.get_sensor_data(device["name"])
+    if not reading:
+        return None
+
+    timestamp = int(current_time.timestamp())
+    device_short_id = device["name"].split("/")[-1]  # Get just the device ID part
+
+    # Try to get a human-readable name from multiple sources
+    device_name = nest_client.get_device_display_name(device)
+
+    reading_data = {
+        "date": current_time.strftime("%Y-%m-%d"),
+        "timestamp_device": f"{timestamp}#{device_short_id}",
+        "device_id": device["name"],
+        "device_name": device_name,
+        "timestamp": timestamp,
+        "readable_time": current_time.isoformat(),
+    }
+    reading_data.update(reading)
+    return reading_data
+
+
+def build_outdoor_reading(weather_client, current_time, tenant=None):
+    with timed("weather"):
+        outdoor_weather = weather_client.get_weather_data()
+    if not outdoor_weather:
+        return None
+
+    device_id = "outdoor_weather"
+    device_name = "Boston, MA (OpenWeather)"
+    if tenant:
+        # Every tenant gets its own outdoor series
+        device_id = f"outdoor_weather-{tenant['id']}"
+        device_name = f"{tenant.get('weather_name', tenant['id'])} (OpenWeather)"
+
+    timestamp = int(current_time.timestamp())
+    outdoor_reading = {
+        "date": current_time.strftime("%Y-%m-%d"),
+        "timestamp_device": f"{timestamp}#{device_id}",
+        "device_id": device_id,
+        "device_name": device_name,
+        "timestamp": timestamp,
+        "readable_time": current_time.isoformat(),
+    }
+    outdoor_reading.update(outdoor_weather)
+    return outdoor_reading
+
+
+class TokenCache:
+    """Cache OAuth access tokens together with their expiry time.
+
+    Tokens are always kept in memory for the life of the container. A JSON
+    file and/or a DynamoDB state item can be added so cold starts and local
+    scripts can pick up a token that is still valid.
+    """
+
+    def __init__(self, path=None, dynamodb_client=None, refresh_margin=None):
+        self.path = path
+        self.dynamodb_client = dynamodb_client
+        if refresh_margin is None:
+            refresh_margin = int(
+                os.environ.get("TOKEN_REFRESH_MARGIN", DEFAULT_TOKEN_REFRESH_MARGIN)
+            )
+        self.refresh_margin = refresh_margin
+        # Tenants polled in parallel share one cache and its file
+        self._file_lock = threading.Lock()
+
+    def get(self, key):
+        """Return a cached token that is not about to expire, or None"""
+        entry = _token_store.get(key)
+        if not self._is_fresh(entry):
+            entry = self._load(key)
+            if self._is_fresh(entry):
+                _token_store[key] = entry
+        return entry["access_token"] if self._is_fresh(entry) else None
+
+    def put(self, key, access_token, expires_in):
+        entry = {
+            "access_token": access_token,
+            "expires_at": int(time.time()) + int(expires_in),
+        }
+        _token_store[key] = entry
+
+        try:
+            if self.path:
+                with self._file_lock:
+                    tokens = self._read_file()
+                    tokens[key] = entry
+                    with open(self.path, "w") as f:
+                        json.dump(tokens, f)
+            if self.dynamodb_client:
+                self.dynamodb_client.put_state(f"nest_token#{key}", entry)
+        except Exception as e:
+            # Persistence is best effort, the in-memory copy is still valid
+            print(f"Error persisting access token: {str(e)}")
+
+    def _is_fresh(self, entry):
+        if not entry:
+            return False
+        return int(entry["expires_at"]) - self.refresh_margin > time.time()
+
+    def _load(self, key):
+        try:
+            if self.path:
+                with self._file_lock:
+                    entry = self._read_file().get(key)
+                if self._is_fresh(entry):
+                    return entry
+            if self.dynamodb_client:
+                return self.dynamodb_client.get_state(f"nest_token#{key}")
+        except Exception as e:
+            print(f"Error loading cached access token: {str(e)}")
+        return None
+
+    def _read_file(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+
+class WeatherCache:
+    """Cache current weather by location for WEATHER_CACHE_TTL seconds.
+
+    Locations are rounded to WEATHER_CACHE_PRECISION decimal places, so
+    homes in the same area share one observation. Entries live in memory
+    for the life of the container and can also be kept in a DynamoDB state
+    item so other deployments and cold starts reuse them. Concurrent misses
+    for the same location wait for a single fetch.
+    """
+
+    def __init__(self, ttl=None, dynamodb_client=None, precision=None):
+        if ttl is None:
+            ttl = int(os.environ.get("WEATHER_CACHE_TTL", DEFAULT_WEATHER_CACHE_TTL))
+        if precision is None:
+            precision = int(
+                os.environ.get(
+                    "WEATHER_CACHE_PRECISION", DEFAULT_WEATHER_CACHE_PRECISION
+                )
+            )
+        self.ttl = ttl
+        self.dynamodb_client = dynamodb_client
+        self.precision = precision
+
+    def get(self, lat, lon, fetch):
+        """Return cached weather for (lat, lon), calling fetch() on a miss"""
+        key = f"{round(float(lat), self.precision)},{round(float(lon), self.precision)}"
+        entry = _weather_store.get(key)
+        if self._is_fresh(entry):
+            return entry["data"]
+
+        with _weather_locks_guard:
+            lock = _weather_locks.setdefault(key, threading.Lock())
+        with lock:
+            # Another thread may have fetched it while we waited
+            entry = _weather_store.get(key)
+            if not self._is_fresh(entry):
+                entry = self._load(key)
+            if not self._is_fresh(entry):
+                entry = {"fetched_at": int(time.time()), "data": fetch()}
+                self._save(key, entry)
+            _weather_store[key] = entry
+            return entry["data"]
+
+    def _is_fresh(self, entry):
+        if not entry:
+            return False
+        return int(entry["fetched_at"]) + self.ttl > time.time()
+
+    def _load(self, key):
+        if not self.dynamodb_client:
+            return None
+        try:
+            item = self.dynamodb_client.get_state(f"weather#{key}")
+        except Exception as e:
+            print(f"Error loading cached weather: {str(e)}")
+            return None
+        if not item:
+            return None
+        # Numbers come back from DynamoDB as Decimal
+        data = {
+            field: (
+                (int(value) if value == value.to_integral_value() else float(value))
+                if isinstance(value, Decimal)
+                else value
+            )
+            for field, value in item["data"].items()
+        }
+        return {"fetched_at": int(item["fetched_at"]), "data": data}
+
+    def _save(self, key, entry):
+        if not self.dynamodb_client:
+            return
+        try:
+            self.dynamodb_client.put_state(f"weather#{key}", entry)
+        except Exception as e:
+            # Persistence is best effort, the in-memory copy is still valid
+            print(f"Error persisting weather: {str(e)}")
+
+
 class NestClient:
-    def __init__(self, client_id, client_secret, refresh_token):
+    def __init__(
+        self,
+        client_id,
+        client_secret,
+        refresh_token,
+        session=None,
+        token_cache=None,
+        project_id=None,
+        scheduler=None,
+    ):
         self.client_id = client_id
         self.client_secret = client_secret
         self.refresh_token = refresh_token
         self.access_token = None
+        self.session = session or create_session()
+        self.scheduler = scheduler or get_request_scheduler()
+        self.token_cache = token_cache or TokenCache(
+            path=os.environ.get("TOKEN_CACHE_FILE")
+        )
+        self._token_lock = threading.Lock()
+        self.project_id = project_id
         self.base_url = "https://smartdevicemanagement.googleapis.com/v1"
 
     def get_access_token(self):
-        if self.access_token:
-            return self.access_token
+        # Never store the refresh token itself as a cache key
+        cache_key = hashlib.sha256(
+            f"{self.client_id}:{self.refresh_token}".encode()
+        ).hexdigest()[:16]
+
+        with self._token_lock:
+            self.access_token = self.token_cache.get(cache_key)
+            if self.access_token:
+                return self.access_token
+            with timed("token_refresh"):
+                return self._refresh_access_token(cache_key)
+
+    def _refresh_access_token(self, cache_key):
 
         token_url = "https://www.googleapis.com/oauth2/v4/token"
         data = {
@@ -99,11 +1177,14 @@ class NestClient:
             "grant_type": "refresh_token",
         }
 
-        response = requests.post(token_url, data=data)
+        response = self.scheduler.request(self.session, "POST", token_url, data=data)
         response.raise_for_status()
 
         token_data = response.json()
         self.access_token = token_data["access_token"]
+        self.token_cache.put(
+            cache_key, self.access_token, token_data.get("expires_in", 3600)
+        )
         return self.access_token
 
     def get_devices(self):
@@ -112,12 +1193,12 @@ class NestClient:
             "Content-Type": "application/json",
         }
 
-        project_id = os.environ.get("NEST_PROJECT_ID")
+        project_id = self.project_id or os.environ.get("NEST_PROJECT_ID")
         if not project_id:
             raise ValueError("NEST_PROJECT_ID environment variable is required")
 
         url = f"{self.base_url}/enterprises/{project_id}/devices"
-        response = requests.get(url, headers=headers)
+        response = self.scheduler.request(self.session, "GET", url, headers=headers)
         response.raise_for_status()
 
         data = response.json()
@@ -130,12 +1211,15 @@ class NestClient:
         }
 
         url = f"{self.base_url}/{device_name}"
-        response = requests.get(url, headers=headers)
+        response = self.scheduler.request(self.session, "GET", url, headers=headers)
         response.raise_for_status()
 
         device_data = response.json()
-        traits = device_data.get("traits", {})
+        return self.extract_sensor_data(device_data.get("traits", {}))
 
+    @staticmethod
+    def extract_sensor_data(traits):
+        """Pull temperature and humidity out of a device traits dict"""
         data = {}
 
         # Get temperature
@@ -179,14 +1263,22 @@ class NestClient:
 
 
 class OpenWeatherClient:
-    def __init__(self, api_key, lat=None, lon=None):
+    def __init__(
+        self, api_key, lat=None, lon=None, session=None, scheduler=None, cache=None
+    ):
         self.api_key = api_key
+        self.session = session or create_session()
+        self.scheduler = scheduler or get_request_scheduler()
+        self.cache = cache or WeatherCache()
         self.base_url = "https://api.openweathermap.org/data/3.0"
         # Use environment variables or defaults to Boston, MA
         self.lat = lat or os.environ.get("WEATHER_LAT", 42.3601)
         self.lon = lon or os.environ.get("WEATHER_LON", -71.0589)
 
     def get_weather_data(self):
+        return self.cache.get(self.lat, self.lon, self._fetch_weather_data)
+
+    def _fetch_weather_data(self):
         url = f"{self.base_url}/onecall"
         params = {
             "lat": self.lat,
@@ -196,9 +1288,7 @@ class OpenWeatherClient:
             "exclude": "minutely,hourly,daily,alerts",  # Only get current weather
         }
 
-        print(url)
-        print(params)
-        response = requests.get(url, params=params)
+        response = self.scheduler.request(self.session, "GET", url, params=params)
         response.raise_for_status()
 
         data = response.json()
@@ -213,51 +1303,3 @@ class OpenWeatherClient:
             "uv_index": current.get("uvi", 0),
             "wind_speed_ms": current.get("wind_speed", 0),
         }
-
-
-class DynamoDBClient:
-    def __init__(self, table_name):
-        self.dynamodb = boto3.resource("dynamodb")
-        self.table = self.dynamodb.Table(table_name)
-
-    def save_readings(self, readings):
-        with self.table.batch_writer() as batch:
-            for reading in readings:
-                # Convert floats to Decimal for DynamoDB
-                converted_reading = self._convert_floats_to_decimal(reading)
-                batch.put_item(Item=converted_reading)
-
-    def _convert_floats_to_decimal(self, obj):
-        """Recursively convert floats to Decimal for DynamoDB compatibility"""
-        if isinstance(obj, float):
-            return Decimal(str(obj))
-        elif isinstance(obj, dict):
-            return {k: self._convert_floats_to_decimal(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._convert_floats_to_decimal(item) for item in obj]
-        else:
-            return obj
-
-    def get_readings_by_date(self, date_str):
-        """Get all readings for a specific date"""
-        response = self.table.query(
-            KeyConditionExpression="#date = :date",
-            ExpressionAttributeNames={"#date": "date"},
-            ExpressionAttributeValues={":date": date_str},
-            ScanIndexForward=True,
-        )
-        return response["Items"]
-
-    def get_readings_date_range(self, start_date, end_date):
-        """Get readings across multiple dates (for charting)"""
-        all_readings = []
-        current_date = datetime.strptime(start_date, "%Y-%m-%d")
-        end_date_obj = datetime.strptime(end_date, "%Y-%m-%d")
-
-        while current_date <= end_date_obj:
-            date_str = current_date.strftime("%Y-%m-%d")
-            readings = self.get_readings_by_date(date_str)
-            all_readings.extend(readings)
-            current_date += timedelta(days=1)
-
-        return sorted(all_readings, key=lambda x: x["timestamp"])
@@ -0,0 +1,114 @@
+"""Local stand-in for the Pub/Sub push subscription that feeds pubsub_handler
+
+Run it, then POST push messages to http://localhost:8080/?token=<token>,
+where the token is PUBSUB_VERIFICATION_TOKEN (a random one is generated and
+printed if it is not set). Each request is handed to pubsub_handler on its
+own thread, so concurrent pushes share batched writes. Use --sample to print
+an example push body, e.g.:
+
+    python local_pubsub.py --sample enterprises/p/devices/d1 21.5 | \\
+        curl -s -X POST --data-binary @- "http://localhost:8080/?token=..."
+"""
+
+import argparse
+import base64
+import json
+import os
+import secrets
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from dotenv import load_dotenv
+from lambda_function import pubsub_handler
+from local_lambda import create_local_table, setup_local_aws
+
+load_dotenv()
+
+
+class PushHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        event = {
+            "body": body.decode(),
+            "queryStringParameters": dict(parse_qsl(urlsplit(self.path).query)),
+        }
+        result = pubsub_handler(event, None)
+
+        payload = result.get("body", "").encode()
+        self.send_response(result["statusCode"])
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def sample_message(device_id, temperature, humidity=None):
+    traits = {
+        "sdm.devices.traits.Temperature": {"ambientTemperatureCelsius": temperature}
+    }
+    if humidity is not None:
+        traits["sdm.devices.traits.Humidity"] = {"ambientHumidityPercent": humidity}
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    event = {
+        "eventId": f"local-{now}",
+        "timestamp": now,
+        "resourceUpdate": {"name": device_id, "traits": traits},
+    }
+    return {
+        "message": {
+            "data": base64.b64encode(json.dumps(event).encode()).decode(),
+            "messageId": event["eventId"],
+            "publishTime": now,
+        },
+        "subscription": "projects/local/subscriptions/nest-events",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Pub/Sub push endpoint")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--batch-wait-ms",
+        type=float,
+        default=200,
+        help="How long a batch waits for more pushes before writing",
+    )
+    parser.add_argument(
+        "--sample",
+        nargs="+",
+        metavar=("DEVICE_ID", "TEMPERATURE"),
+        help="Print a push body for DEVICE_ID TEMPERATURE [HUMIDITY] and exit",
+    )
+    args = parser.parse_args()
+
+    if args.sample:
+        device_id, temperature, *humidity = args.sample
+        print(
+            json.dumps(
+                sample_message(
+                    device_id,
+                    float(temperature),
+                    float(humidity[0]) if humidity else None,
+                )
+            )
+        )
+        return 0
+
+    os.environ["PUBSUB_BATCH_WAIT_MS"] = str(args.batch_wait_ms)
+    setup_local_aws()
+    create_local_table()
+
+    token = os.environ.get("PUBSUB_VERIFICATION_TOKEN") or secrets.token_urlsafe(24)
+    os.environ["PUBSUB_VERIFICATION_TOKEN"] = token
+    server = ThreadingHTTPServer(("localhost", args.port), PushHandler)
+    print(f"Listening for push messages on http://localhost:{args.port}/?token={token}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
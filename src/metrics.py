@@ -0,0 +1,121 @@
+"""Per-invocation timings, printed as CloudWatch embedded metric format lines"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Timings of the running invocation, see instrumented() and timed()
+_metrics = {"current": None}
+DEFAULT_METRICS_NAMESPACE = "HomeTempMonitor"
+
+
+def instrumented(handler):
+    """Time a Lambda handler and everything it does inside timed() blocks
+
+    At the end of the invocation the timings are printed as one CloudWatch
+    embedded metric format (EMF) line and added to the response body as
+    {"timings": {name: {"n": calls, "ms": total}}}. METRICS_ENABLED=false
+    turns all of it off.
+    """
+
+    @wraps(handler)
+    def wrapper(event, context):
+        if os.environ.get("METRICS_ENABLED", "true").lower() != "true":
+            return handler(event, context)
+
+        timings = _metrics["current"] = Timings()
+        try:
+            with timed("total"):
+                response = handler(event, context)
+        finally:
+            _metrics["current"] = None
+
+        timings.emit(handler.__name__)
+        try:
+            body = json.loads(response["body"])
+            body["timings"] = timings.summary()
+            response["body"] = json.dumps(body)
+        except (KeyError, TypeError, ValueError):
+            pass
+        return response
+
+    return wrapper
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current invocation's timings"""
+    timings = _metrics["current"]
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+class Timings:
+    """Call counts and total seconds per name, safe to add to from threads"""
+
+    def __init__(self):
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            count, total = self.totals.get(name, (0, 0.0))
+            self.totals[name] = (count + 1, total + seconds)
+
+    def summary(self):
+        return {
+            name: {"n": count, "ms": round(total * 1000, 1)}
+            for name, (count, total) in sorted(self.totals.items())
+        }
+
+    def emit(self, handler_name):
+        """Print the timings as a CloudWatch EMF metric line"""
+        metrics = []
+        line = {"Handler": handler_name}
+        for name, (count, total) in sorted(self.totals.items()):
+            metrics.append({"Name": f"{name}.ms", "Unit": "Milliseconds"})
+            metrics.append({"Name": f"{name}.count", "Unit": "Count"})
+            line[f"{name}.ms"] = round(total * 1000, 1)
+            line[f"{name}.count"] = count
+
+        line["_aws"] = {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": os.environ.get(
+                        "METRICS_NAMESPACE", DEFAULT_METRICS_NAMESPACE
+                    ),
+                    "Dimensions": [["Handler"]],
+                    "Metrics": metrics,
+                }
+            ],
+        }
+        print(json.dumps(line))
+
+
+def instrument_boto_client(client):
+    """Time every API call a boto3 client makes as dynamodb.<Operation>"""
+
+    def before_call(model, context, **kwargs):
+        context["timing_start"] = time.perf_counter()
+
+    def after_call(model, context, **kwargs):
+        timings = _metrics["current"]
+        if timings is not None and "timing_start" in context:
+            timings.add(
+                f"dynamodb.{model.name}", time.perf_counter() - context["timing_start"]
+            )
+
+    events = client.meta.events
+    events.register("before-call.dynamodb", before_call)
+    events.register("after-call.dynamodb", after_call)
+    return client
@@ -0,0 +1,1356 @@
+"""Reading storage: the DynamoDB table, packed day blocks and the archive"""
+
+import heapq
+import json
+import math
+import os
+import sys
+import threading
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+try:
+    from .metrics import instrument_boto_client
+except ImportError:  # loaded as a top-level module in Lambda
+    from metrics import instrument_boto_client
+
+# Partition key holding small bookkeeping items in the readings table
+STATE_PARTITION = "_state"
+
+# Per-day queries run in parallel when reading a date range
+DEFAULT_QUERY_WORKERS = 8
+
+# Values aggregated into the hourly and daily rollups
+ROLLUP_METRICS = ("temperature_celsius", "humidity_percent")
+ROLLUP_RESOLUTIONS = ("hour", "day")
+
+# Compacted days store one "block#<device>" item per device in the day's
+# partition instead of one item per reading
+BLOCK_PREFIX = "block#"
+BLOCK_LAYOUT = "packed-v1"
+# Leave headroom under DynamoDB's 400 KB item limit
+MAX_BLOCK_BYTES = 350 * 1024
+# Reading fields rebuilt from the block key rather than stored per reading
+BLOCK_KEY_FIELDS = (
+    "date",
+    "timestamp_device",
+    "device_id",
+    "device_name",
+    "timestamp",
+    "readable_time",
+)
+
+# Completed months moved out of the table live in one file per month under
+# ARCHIVE_DIR, see ReadingArchive and DynamoDBClient.archive_month
+ARCHIVE_LAYOUT = "archive-v1"
+# A month is only archived once late writes for it have landed; Pub/Sub
+# redelivers a push for up to 7 days
+ARCHIVE_GRACE = timedelta(days=8)
+# Decoded archive months kept in memory per ReadingArchive
+ARCHIVE_CACHE_MONTHS = 4
+# Block attributes kept in an archive file's index
+ARCHIVE_INDEX_FIELDS = ("date", "timestamp_device", "device_id", "device_name", "count")
+
+
+def get_dynamodb_resource():
+    import boto3
+
+    resource = boto3.resource("dynamodb")
+    instrument_boto_client(resource.meta.client)
+    return resource
+
+
+class ReadingArchive:
+    """Completed months of readings stored as one file per month
+
+    Each file holds the month's packed blocks (one per device per day, same
+    encoding as compact_day) behind a JSON index. A local directory stands
+    in for object storage; files are only ever written whole.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._months = {}
+        self._lock = threading.Lock()
+
+    def has_month(self, month):
+        return os.path.exists(self._path(month))
+
+    def get_blocks(self, date_str):
+        """Return one day's block items, or None if its month is not archived"""
+        month = self._load(date_str[:7])
+        if month is None:
+            return None
+        return month.get(date_str, [])
+
+    def write_month(self, month, blocks):
+        index = []
+        payloads = []
+        for block in blocks:
+            entry = {field: block[field] for field in ARCHIVE_INDEX_FIELDS}
+            entry["length"] = len(block["columns"])
+            index.append(entry)
+            payloads.append(block["columns"])
+
+        header = json.dumps(
+            {"layout": ARCHIVE_LAYOUT, "month": month, "blocks": index}
+        ).encode()
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(month)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(len(header).to_bytes(4, "little"))
+            f.write(header)
+            for payload in payloads:
+                f.write(payload)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._months.pop(month, None)
+
+    def _load(self, month):
+        with self._lock:
+            if month in self._months:
+                return self._months[month]
+            try:
+                with open(self._path(month), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return None
+
+            header_length = int.from_bytes(data[:4], "little")
+            header = json.loads(data[4 : 4 + header_length])
+            offset = 4 + header_length
+            days = {}
+            for entry in header["blocks"]:
+                length = entry.pop("length")
+                entry["layout"] = BLOCK_LAYOUT
+                entry["columns"] = data[offset : offset + length]
+                offset += length
+                days.setdefault(entry["date"], []).append(entry)
+
+            if len(self._months) >= ARCHIVE_CACHE_MONTHS:
+                self._months.pop(next(iter(self._months)))
+            self._months[month] = days
+            return days
+
+    def _path(self, month):
+        return os.path.join(self.directory, f"{month}.blocks")
+
+
+class DynamoDBClient:
+    def __init__(self, table_name, dynamodb=None, rollups=None, archive=None):
+        self.dynamodb = dynamodb or get_dynamodb_resource()
+        self.table_name = table_name
+        self.table = self.dynamodb.Table(table_name)
+        if rollups is None:
+            rollups = os.environ.get("ROLLUPS_ENABLED", "false").lower() == "true"
+        self.rollups = rollups
+        if archive is None and os.environ.get("ARCHIVE_DIR"):
+            archive = ReadingArchive(os.environ["ARCHIVE_DIR"])
+        self.archive = archive
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def save_readings(self, readings):
+        """Write readings, folding them into the rollups if enabled
+
+        Readings already counted in their rollups (a retried write) are not
+        counted again, see _fold_rollups.
+        """
+        with self.table.batch_writer() as batch:
+            for reading in readings:
+                # Convert floats to Decimal for DynamoDB
+                converted_reading = self._convert_floats_to_decimal(reading)
+                batch.put_item(Item=converted_reading)
+
+        if self.rollups:
+            self._fold_rollups(readings)
+
+    def merge_readings(self, readings):
+        """Write readings with UpdateItem SET, keeping other stored attributes
+
+        For push events, which carry one trait each: a humidity event adds
+        to the temperature already stored for the same device and second
+        instead of replacing it. Rollups are updated as in save_readings.
+        """
+        for reading in readings:
+            attributes = {
+                field: value
+                for field, value in self._convert_floats_to_decimal(reading).items()
+                if field not in ("date", "timestamp_device")
+            }
+            names = {f"#f{i}": field for i, field in enumerate(attributes)}
+            self.table.update_item(
+                Key={
+                    "date": reading["date"],
+                    "timestamp_device": reading["timestamp_device"],
+                },
+                UpdateExpression="SET "
+                + ", ".join(f"{name} = :v{name[2:]}" for name in names),
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={
+                    f":v{i}": value for i, value in enumerate(attributes.values())
+                },
+            )
+
+        if self.rollups:
+            self._fold_rollups(readings)
+
+    def rebuild_rollups(self, date_str):
+        """Recompute the hourly and daily rollups of one UTC day from raw data"""
+        rollups = {}
+        for reading in self.get_readings_by_date(date_str):
+            for resolution in ROLLUP_RESOLUTIONS:
+                key = self._rollup_key(resolution, reading)
+                rollups[key] = self._fold_reading(rollups.get(key), reading, key)
+
+        with self.table.batch_writer() as batch:
+            for rollup in rollups.values():
+                batch.put_item(Item=self._convert_floats_to_decimal(rollup))
+        return len(rollups)
+
+    def compact_day(self, date_str):
+        """Pack a completed day's raw readings into one block item per device
+
+        Blocks are written before the raw items are deleted. Re-running after
+        an interruption folds any leftover raw items into the blocks again.
+        Rollups record which readings they counted themselves, so a reading
+        saved again after its raw item was packed is not counted twice.
+        """
+        items = self._query_all(
+            {
+                "KeyConditionExpression": "#date = :date",
+                "ExpressionAttributeNames": {"#date": "date"},
+                "ExpressionAttributeValues": {":date": date_str},
+            }
+        )
+
+        raw_keys = []
+        by_device = {}
+        for item in items:
+            if item.get("layout") == BLOCK_LAYOUT:
+                device_short_id = item["timestamp_device"][len(BLOCK_PREFIX) :]
+                by_device.setdefault(device_short_id, {}).update(
+                    {r["timestamp_device"]: r for r in self._unpack_block(item)}
+                )
+            else:
+                raw_keys.append(item["timestamp_device"])
+                device_short_id = item["timestamp_device"].split("#", 1)[1]
+                by_device.setdefault(device_short_id, {})[
+                    item["timestamp_device"]
+                ] = item
+
+        if not raw_keys:
+            return 0
+
+        packed_keys = []
+        with self.table.batch_writer() as batch:
+            for device_short_id, readings in by_device.items():
+                readings = sorted(readings.values(), key=lambda r: int(r["timestamp"]))
+                block = self._pack_block(date_str, device_short_id, readings)
+                if len(block["columns"]) > MAX_BLOCK_BYTES:
+                    print(f"Skipping compaction of {device_short_id}: block too large")
+                    continue
+                batch.put_item(Item=block)
+                packed_keys.extend(r["timestamp_device"] for r in readings)
+
+        packed_keys = set(packed_keys)
+        deleted = 0
+        with self.table.batch_writer() as batch:
+            for sort_key in raw_keys:
+                if sort_key in packed_keys:
+                    batch.delete_item(
+                        Key={"date": date_str, "timestamp_device": sort_key}
+                    )
+                    deleted += 1
+        return deleted
+
+    def archive_month(self, month):
+        """Move a completed month (YYYY-MM) from the table to the archive
+
+        The archive file is written before anything is deleted, and only
+        the items that went into it are deleted. Items still in the table
+        for an archived month (an interrupted run, or a write that landed
+        after archiving) are merged into the file when this runs again, so
+        it is safe to repeat. Rollups stay in the table. Returns the number
+        of readings moved out of the table.
+        """
+        if self.archive is None:
+            raise ValueError("No archive configured, set ARCHIVE_DIR")
+
+        first_day = datetime.strptime(month, "%Y-%m")
+        next_month = (first_day + timedelta(days=32)).replace(day=1)
+        if datetime.utcnow() < next_month + ARCHIVE_GRACE:
+            raise ValueError(f"{month} has not ended yet")
+        dates = self.date_strings(
+            first_day.strftime("%Y-%m-%d"),
+            (next_month - timedelta(days=1)).strftime("%Y-%m-%d"),
+        )
+
+        table_items = {
+            date_str: self._query_all(
+                {
+                    "KeyConditionExpression": "#date = :date",
+                    "ExpressionAttributeNames": {"#date": "date"},
+                    "ExpressionAttributeValues": {":date": date_str},
+                }
+            )
+            for date_str in dates
+        }
+        if not any(table_items.values()) and self.archive.has_month(month):
+            return 0
+
+        archived = 0
+        blocks = []
+        for date_str in dates:
+            readings = {}
+            for reading in self._expand_blocks(self.archive.get_blocks(date_str) or []):
+                readings[reading["timestamp_device"]] = reading
+            table_readings = self._expand_blocks(table_items[date_str])
+            for reading in table_readings:
+                readings.setdefault(reading["timestamp_device"], {}).update(reading)
+            archived += len(table_readings)
+
+            by_device = {}
+            for reading in sorted(
+                readings.values(),
+                key=lambda r: (int(r["timestamp"]), r["timestamp_device"]),
+            ):
+                device_short_id = reading["timestamp_device"].split("#", 1)[1]
+                by_device.setdefault(device_short_id, []).append(reading)
+            for device_short_id, device_readings in by_device.items():
+                blocks.append(
+                    self._pack_block(date_str, device_short_id, device_readings)
+                )
+        self.archive.write_month(month, blocks)
+
+        with self.table.batch_writer() as batch:
+            for date_str, items in table_items.items():
+                for item in items:
+                    batch.delete_item(
+                        Key={
+                            "date": date_str,
+                            "timestamp_device": item["timestamp_device"],
+                        }
+                    )
+        return archived
+
+    @staticmethod
+    def _pack_block(date_str, device_short_id, readings):
+        """Encode one device's day as zlib-compressed little-endian columns
+
+        Timestamps are delta-encoded int64s; every other numeric field is a
+        float64 column with NaN for missing values. Text fields other than the
+        key fields are kept as JSON lists. Fields are classified by their
+        non-None values; a field with any non-numeric value is text.
+        """
+        numeric = {}
+        for reading in readings:
+            for field, value in reading.items():
+                if field in BLOCK_KEY_FIELDS or value is None:
+                    continue
+                is_number = isinstance(value, (int, float, Decimal)) and not (
+                    isinstance(value, bool)
+                )
+                numeric[field] = numeric.get(field, True) and is_number
+        numeric_fields = [field for field, is_number in numeric.items() if is_number]
+        text_fields = {
+            field: [
+                (
+                    float(reading[field])
+                    if isinstance(reading.get(field), Decimal)
+                    else reading.get(field)
+                )
+                for reading in readings
+            ]
+            for field, is_number in numeric.items()
+            if not is_number
+        }
+
+        timestamps = [int(reading["timestamp"]) for reading in readings]
+        columns = [array("q", [b - a for a, b in zip([0] + timestamps, timestamps)])]
+        for field in numeric_fields:
+            columns.append(
+                array(
+                    "d",
+                    [
+                        (
+                            float("nan")
+                            if reading.get(field) is None
+                            else float(reading[field])
+                        )
+                        for reading in readings
+                    ],
+                )
+            )
+
+        header = json.dumps(
+            {"count": len(readings), "numeric": numeric_fields, "text": text_fields}
+        ).encode()
+        body = bytearray(len(header).to_bytes(4, "little") + header)
+        for column in columns:
+            if sys.byteorder == "big":
+                column.byteswap()
+            body += column.tobytes()
+
+        return {
+            "date": date_str,
+            "timestamp_device": f"{BLOCK_PREFIX}{device_short_id}",
+            "layout": BLOCK_LAYOUT,
+            "device_id": readings[-1]["device_id"],
+            "device_name": readings[-1]["device_name"],
+            "count": len(readings),
+            "columns": zlib.compress(bytes(body), 9),
+        }
+
+    @staticmethod
+    def _unpack_block(item):
+        """Decode a packed block back into reading dicts, in timestamp order
+
+        readable_time is rebuilt from the timestamp, so sub-second precision
+        of the original value is not preserved.
+        """
+        payload = item["columns"]
+        header, timestamps, columns = DynamoDBClient._decode_block_payload(
+            getattr(payload, "value", payload)
+        )
+
+        device_short_id = item["timestamp_device"][len(BLOCK_PREFIX) :]
+        readings = []
+        for i, timestamp in enumerate(timestamps):
+            reading = {
+                "date": item["date"],
+                "timestamp_device": f"{timestamp}#{device_short_id}",
+                "device_id": item["device_id"],
+                "device_name": item["device_name"],
+                "timestamp": timestamp,
+                "readable_time": datetime.utcfromtimestamp(timestamp).isoformat(),
+            }
+            for field, column in zip(header["numeric"], columns):
+                if column[i] == column[i]:  # NaN marks a missing value
+                    reading[field] = column[i]
+            for field, values in header["text"].items():
+                if values[i] is not None:
+                    reading[field] = values[i]
+            readings.append(reading)
+        return readings
+
+    @staticmethod
+    def _decode_block_payload(payload):
+        """Return (header, timestamps, numeric columns) of a block payload"""
+        payload = zlib.decompress(payload)
+        header_length = int.from_bytes(payload[:4], "little")
+        header = json.loads(payload[4 : 4 + header_length])
+        count = header["count"]
+
+        offset = 4 + header_length
+        columns = []
+        for typecode in ["q"] + ["d"] * len(header["numeric"]):
+            column = array(typecode)
+            size = column.itemsize * count
+            column.frombytes(payload[offset : offset + size])
+            if sys.byteorder == "big":
+                column.byteswap()
+            columns.append(column)
+            offset += size
+
+        timestamps = []
+        total = 0
+        for delta in columns[0]:
+            total += delta
+            timestamps.append(total)
+        return header, timestamps, columns[1:]
+
+    def _expand_blocks(self, items):
+        """Replace packed block items with their readings, in timestamp order"""
+        blocks = [item for item in items if item.get("layout") == BLOCK_LAYOUT]
+        if not blocks:
+            return items
+
+        raw = [item for item in items if item.get("layout") != BLOCK_LAYOUT]
+        raw_keys = {item["timestamp_device"] for item in raw}
+        # Skip readings still present as raw items mid-compaction
+        decoded = [
+            [
+                r
+                for r in self._unpack_block(block)
+                if r["timestamp_device"] not in raw_keys
+            ]
+            for block in blocks
+        ]
+        return list(
+            heapq.merge(
+                raw,
+                *decoded,
+                key=lambda x: (int(x["timestamp"]), x["timestamp_device"]),
+            )
+        )
+
+    def get_rollups_time_window(self, resolution, start_time, end_time):
+        """Get hourly or daily rollups whose bucket starts inside the window
+
+        Items look like readings (device_name, timestamp, temperature_celsius,
+        humidity_percent hold the bucket start and means) plus per-metric
+        _min, _max, _sum and _count fields.
+        """
+        if resolution not in ROLLUP_RESOLUTIONS:
+            raise ValueError(f"Unknown rollup resolution: {resolution}")
+
+        start_time = as_utc(start_time)
+        end_time = as_utc(end_time)
+        start_timestamp = int(start_time.timestamp())
+        end_timestamp = int(end_time.timestamp())
+
+        dates = self.date_strings(
+            start_time.strftime("%Y-%m-%d"), end_time.strftime("%Y-%m-%d")
+        )
+        if resolution == "day":
+            # Daily rollups are partitioned by month
+            dates = sorted({date_str[:7] for date_str in dates})
+        partitions = [f"rollup#{resolution}#{date_str}" for date_str in dates]
+
+        def query_partition(partition):
+            return self.get_readings_between(partition, start_timestamp, end_timestamp)
+
+        rollups = self._query_days(query_partition, partitions, None)
+        for rollup in rollups:
+            rollup.pop("version", None)
+            # Means are derived here; writers only add to counts and sums
+            for metric in ROLLUP_METRICS:
+                rollup.pop(f"{metric}_times", None)
+                if rollup.get(f"{metric}_count"):
+                    rollup[metric] = rollup[f"{metric}_sum"] / rollup[f"{metric}_count"]
+        return rollups
+
+    def add_to_rollups(self, readings):
+        """Count readings that are not stored as raw items in the rollups
+
+        For polls the deadband skipped: the charts step-fill them, so the
+        rollups include them too. Does nothing unless rollups are enabled.
+        """
+        if self.rollups and readings:
+            self._fold_rollups(readings)
+
+    def _fold_rollups(self, readings):
+        """Add readings to the stored rollups they belong to
+
+        Each rollup keeps the timestamps folded into it per metric
+        (<metric>_times), so a reading saved again is not counted twice,
+        while separate temperature and humidity events for one second both
+        count. Every bucket takes one UpdateItem, conditioned on the version
+        of the rollup it was computed from; when another writer got there
+        first the rollup is read again and the update retried.
+        """
+        buckets = {}
+        for reading in readings:
+            for resolution in ROLLUP_RESOLUTIONS:
+                key = self._rollup_key(resolution, reading)
+                buckets.setdefault(key, []).append(reading)
+        if not buckets:
+            return
+
+        stored = self._batch_get(list(buckets))
+        for key, bucket_readings in buckets.items():
+            rollup = stored.get(key)
+            while not self._update_rollup(key, rollup, bucket_readings):
+                rollup = self.table.get_item(
+                    Key={"date": key[0], "timestamp_device": key[1]},
+                    ConsistentRead=True,
+                ).get("Item")
+
+    def _update_rollup(self, key, rollup, readings):
+        """Fold readings not yet in rollup (as stored) into it with one update
+
+        Returns False if the stored rollup changed since it was read.
+        """
+        rollup = rollup or {}
+        folded = {
+            metric: {int(t) for t in rollup.get(f"{metric}_times", ())}
+            for metric in ROLLUP_METRICS
+        }
+        seen = set().union(*folded.values())
+        added = {}
+        new_times = set()
+        for reading in readings:
+            timestamp = int(reading["timestamp"])
+            for metric in ROLLUP_METRICS:
+                if reading.get(metric) is None or timestamp in folded[metric]:
+                    continue
+                folded[metric].add(timestamp)
+                added.setdefault(metric, []).append((timestamp, float(reading[metric])))
+                if timestamp not in seen:
+                    seen.add(timestamp)
+                    new_times.add(timestamp)
+        if not added:
+            return True
+
+        names = {"#timestamp": "timestamp", "#count": "count", "#version": "version"}
+        values = {
+            ":device_id": readings[-1]["device_id"],
+            ":device_name": readings[-1]["device_name"],
+            ":timestamp": int(key[1].split("#", 1)[0]),
+            ":count": len(new_times),
+            ":one": 1,
+        }
+        assigned = [
+            "device_id = :device_id",
+            "device_name = :device_name",
+            "#timestamp = :timestamp",
+        ]
+        increments = ["#count :count", "#version :one"]
+        for metric, points in added.items():
+            metric_values = [value for _, value in points]
+            values[f":{metric}_count"] = len(points)
+            values[f":{metric}_sum"] = math.fsum(metric_values)
+            values[f":{metric}_times"] = {timestamp for timestamp, _ in points}
+            for suffix in ("count", "sum", "times"):
+                increments.append(f"{metric}_{suffix} :{metric}_{suffix}")
+            # Bounds are only written when this batch extends them
+            low, high = min(metric_values), max(metric_values)
+            if f"{metric}_min" not in rollup or low < rollup[f"{metric}_min"]:
+                values[f":{metric}_min"] = low
+                assigned.append(f"{metric}_min = :{metric}_min")
+            if f"{metric}_max" not in rollup or high > rollup[f"{metric}_max"]:
+                values[f":{metric}_max"] = high
+                assigned.append(f"{metric}_max = :{metric}_max")
+
+        if "version" in rollup:
+            condition = "#version = :version"
+            values[":version"] = rollup["version"]
+        else:
+            condition = "attribute_not_exists(#version)"
+
+        try:
+            self.table.update_item(
+                Key={"date": key[0], "timestamp_device": key[1]},
+                UpdateExpression=f"SET {', '.join(assigned)} "
+                f"ADD {', '.join(increments)}",
+                ConditionExpression=condition,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=self._convert_floats_to_decimal(values),
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    @staticmethod
+    def _rollup_key(resolution, reading):
+        """Return the (date, timestamp_device) key of a reading's rollup"""
+        timestamp = int(reading["timestamp"])
+        device_short_id = reading["timestamp_device"].split("#", 1)[1]
+        bucket_time = datetime.fromtimestamp(timestamp, timezone.utc)
+
+        if resolution == "hour":
+            bucket_start = timestamp - timestamp % 3600
+            partition = f"rollup#hour#{bucket_time.strftime('%Y-%m-%d')}"
+        else:
+            bucket_start = timestamp - timestamp % 86400
+            partition = f"rollup#day#{bucket_time.strftime('%Y-%m')}"
+        return partition, f"{bucket_start}#{device_short_id}"
+
+    @staticmethod
+    def _fold_reading(rollup, reading, key):
+        """Fold one reading into an in-memory rollup (None starts a new one)"""
+        if rollup is None:
+            rollup = {
+                "date": key[0],
+                "timestamp_device": key[1],
+                "device_id": reading["device_id"],
+                "device_name": reading["device_name"],
+                "timestamp": int(key[1].split("#", 1)[0]),
+                "count": 0,
+            }
+
+        rollup["count"] = int(rollup["count"]) + 1
+        rollup["device_name"] = reading["device_name"]
+
+        for metric in ROLLUP_METRICS:
+            if reading.get(metric) is None:
+                continue
+            value = float(reading[metric])
+            count = int(rollup.get(f"{metric}_count", 0))
+            if count == 0:
+                total, low, high = value, value, value
+            else:
+                total = float(rollup[f"{metric}_sum"]) + value
+                low = min(float(rollup[f"{metric}_min"]), value)
+                high = max(float(rollup[f"{metric}_max"]), value)
+            rollup[f"{metric}_count"] = count + 1
+            rollup[f"{metric}_sum"] = total
+            rollup[f"{metric}_min"] = low
+            rollup[f"{metric}_max"] = high
+            rollup.setdefault(f"{metric}_times", set()).add(int(reading["timestamp"]))
+            rollup[metric] = total / (count + 1)
+        return rollup
+
+    def _batch_get(self, keys):
+        """Fetch items by (date, timestamp_device) key as {key: item}"""
+        items = {}
+        for i in range(0, len(keys), 100):
+            request = {
+                self.table_name: {
+                    "Keys": [
+                        {"date": date, "timestamp_device": sort_key}
+                        for date, sort_key in keys[i : i + 100]
+                    ]
+                }
+            }
+            while request:
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(self.table_name, []):
+                    items[(item["date"], item["timestamp_device"])] = item
+                request = response.get("UnprocessedKeys")
+        return items
+
+    def get_state(self, name):
+        """Read a bookkeeping item stored outside the per-day partitions
+
+        State is read and written from worker threads (token and weather
+        caches, tenant polls), so it goes through the low-level client.
+        """
+        response = self._low_level_client().get_item(
+            TableName=self.table_name,
+            Key=_serialize_item({"date": STATE_PARTITION, "timestamp_device": name}),
+        )
+        item = response.get("Item")
+        return _deserialize_item(item) if item else None
+
+    def put_state(self, name, attributes):
+        item = {"date": STATE_PARTITION, "timestamp_device": name}
+        item.update(attributes)
+        self._low_level_client().put_item(
+            TableName=self.table_name,
+            Item=_serialize_item(self._convert_floats_to_decimal(item)),
+        )
+
+    def _convert_floats_to_decimal(self, obj):
+        """Recursively convert floats to Decimal for DynamoDB compatibility"""
+        if isinstance(obj, float):
+            return Decimal(str(obj))
+        elif isinstance(obj, dict):
+            return {k: self._convert_floats_to_decimal(v) for k, v in obj.items()}
+        elif isinstance(obj, list):
+            return [self._convert_floats_to_decimal(item) for item in obj]
+        else:
+            return obj
+
+    def get_readings_by_date(self, date_str):
+        """Get all readings for a specific date, following every page"""
+        blocks = self._archived_blocks(date_str)
+        if blocks is not None:
+            return self._expand_blocks(blocks)
+        return self._table_readings_by_date(date_str)
+
+    def _table_readings_by_date(self, date_str):
+        return self._expand_blocks(
+            self._query_all(
+                {
+                    "KeyConditionExpression": "#date = :date",
+                    "ExpressionAttributeNames": {"#date": "date"},
+                    "ExpressionAttributeValues": {":date": date_str},
+                    "ScanIndexForward": True,
+                }
+            )
+        )
+
+    def _archived_blocks(self, date_str):
+        """A day's blocks if its month has been archived, otherwise None"""
+        if self.archive is None:
+            return None
+        return self.archive.get_blocks(date_str)
+
+    def _get_blocks(self, date_str):
+        """Get the packed block items of one day's partition"""
+        return self._query_all(
+            {
+                "KeyConditionExpression": "#date = :date AND "
+                "begins_with(timestamp_device, :prefix)",
+                "ExpressionAttributeNames": {"#date": "date"},
+                "ExpressionAttributeValues": {
+                    ":date": date_str,
+                    ":prefix": BLOCK_PREFIX,
+                },
+            }
+        )
+
+    def load_columns_by_date(self, date_str):
+        """Load one day as typed column arrays, see load_columns_time_window"""
+        blocks = self._archived_blocks(date_str)
+        if blocks is not None:
+            return self._archived_columns(blocks)
+        return self._load_columns(
+            {
+                "KeyConditionExpression": "#date = :date",
+                "ExpressionAttributeNames": {"#date": "date"},
+                "ExpressionAttributeValues": {":date": {"S": date_str}},
+            }
+        )
+
+    def load_columns_time_window(self, start_time, end_time, max_workers=None):
+        """Load readings in a UTC window as {field: numpy array}
+
+        Reads DynamoDB's wire format through a plain low-level client and
+        decodes it straight into columns: timestamp is int64, other numbers
+        are float64 (NaN when missing) and strings are object arrays. No
+        per-reading dicts or Decimals are created. Packed blocks are decoded
+        as well, so the result matches get_readings_time_window.
+        """
+        start_time = as_utc(start_time)
+        end_time = as_utc(end_time)
+        start_timestamp = int(start_time.timestamp())
+        end_timestamp = int(end_time.timestamp())
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+        def load_day(date_str):
+            blocks = self._archived_blocks(date_str)
+            if blocks is not None:
+                return self._archived_columns(blocks, start_timestamp, end_timestamp)
+            columns = self._load_columns(
+                self._wire_window_query(date_str, start_timestamp, end_timestamp)
+            )
+            if date_str >= today:
+                return columns
+            # Only completed days can have been compacted
+            blocks = self._window_blocks(
+                date_str,
+                start_timestamp,
+                end_timestamp,
+                columns.get("timestamp_device", ()),
+            )
+            return _concat_columns([c for c in (columns, blocks) if c])
+
+        dates = self.date_strings(
+            start_time.strftime("%Y-%m-%d"), end_time.strftime("%Y-%m-%d")
+        )
+        days = [day for day in self._map_days(load_day, dates, max_workers) if day]
+        if not days:
+            return {}
+        return _concat_columns(days)
+
+    def load_columns_after(self, last_timestamp, end_time, seen_keys=()):
+        """Load readings from last_timestamp up to end_time as columns
+
+        Each day from last_timestamp's onward is read with a key range
+        starting at it, so the cost depends only on how many readings are
+        newer. Readings written at last_timestamp are read again, since
+        another device's may have landed after the previous call, and the
+        timestamp_device keys in seen_keys are dropped. Packed blocks and
+        archives hold finished days and are not read.
+        """
+        import numpy as np
+
+        end_time = as_utc(end_time)
+        start_time = datetime.fromtimestamp(int(last_timestamp), timezone.utc)
+        if start_time > end_time:
+            return {}
+
+        days = []
+        for date_str in self.date_strings(
+            start_time.strftime("%Y-%m-%d"), end_time.strftime("%Y-%m-%d")
+        ):
+            columns = self._load_columns(
+                {
+                    "KeyConditionExpression": "#date = :date AND "
+                    "timestamp_device BETWEEN :start AND :end",
+                    "ExpressionAttributeNames": {"#date": "date"},
+                    "ExpressionAttributeValues": {
+                        ":date": {"S": date_str},
+                        # A bare timestamp sorts before every key written at it
+                        ":start": {"S": str(int(last_timestamp))},
+                        ":end": {"S": f"{int(end_time.timestamp())}#~"},
+                    },
+                }
+            )
+            if not columns:
+                continue
+            unseen = ~np.isin(columns["timestamp_device"], list(seen_keys))
+            days.append({field: values[unseen] for field, values in columns.items()})
+
+        days = [day for day in days if len(day["timestamp"])]
+        if not days:
+            return {}
+        return _concat_columns(days)
+
+    def iter_column_pages(self, start_time, end_time):
+        """Yield readings in a UTC window one query page at a time
+
+        Each page is a {field: numpy array} dict like load_columns_time_window
+        returns, so memory use is bounded by the page size (about 1 MB of
+        items) rather than the length of the range. Days are read in order;
+        a compacted day's blocks come after its raw items.
+        """
+        start_time = as_utc(start_time)
+        end_time = as_utc(end_time)
+        start_timestamp = int(start_time.timestamp())
+        end_timestamp = int(end_time.timestamp())
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+        dates = self.date_strings(
+            start_time.strftime("%Y-%m-%d"), end_time.strftime("%Y-%m-%d")
+        )
+        for date_str in dates:
+            blocks = self._archived_blocks(date_str)
+            if blocks is not None:
+                columns = self._archived_columns(blocks, start_timestamp, end_timestamp)
+                if columns and len(columns["timestamp"]):
+                    yield columns
+                continue
+            query_kwargs = self._wire_window_query(
+                date_str, start_timestamp, end_timestamp
+            )
+            seen = []
+            for items in self._query_wire_pages(query_kwargs):
+                builder = _ColumnBuilder()
+                builder.add_items(items)
+                columns = builder.build()
+                if columns and len(columns["timestamp"]):
+                    seen.extend(columns["timestamp_device"])
+                    yield columns
+            if date_str < today:
+                # Only completed days can have been compacted
+                columns = self._window_blocks(
+                    date_str, start_timestamp, end_timestamp, seen
+                )
+                if columns:
+                    yield columns
+
+    def _wire_window_query(self, date_str, start_timestamp, end_timestamp):
+        """Low-level query arguments for the raw items of a day in a window"""
+        return {
+            "KeyConditionExpression": "#date = :date AND "
+            "timestamp_device BETWEEN :start AND :end",
+            "ExpressionAttributeNames": {"#date": "date"},
+            "ExpressionAttributeValues": {
+                ":date": {"S": date_str},
+                ":start": {"S": str(start_timestamp)},
+                ":end": {"S": f"{end_timestamp}#~"},
+            },
+        }
+
+    def _window_blocks(self, date_str, start_timestamp, end_timestamp, seen_keys):
+        """Columns of a day's packed blocks inside a window, or {} if none
+
+        Blocks are keyed outside the timestamp range, so they take their own
+        begins_with query. Readings in seen_keys (raw items left mid-
+        compaction) are dropped.
+        """
+        import numpy as np
+
+        columns = self._load_columns(
+            {
+                "KeyConditionExpression": "#date = :date AND "
+                "begins_with(timestamp_device, :prefix)",
+                "ExpressionAttributeNames": {"#date": "date"},
+                "ExpressionAttributeValues": {
+                    ":date": {"S": date_str},
+                    ":prefix": {"S": BLOCK_PREFIX},
+                },
+            }
+        )
+        if not columns:
+            return {}
+        mask = (columns["timestamp"] >= start_timestamp) & (
+            columns["timestamp"] <= end_timestamp
+        )
+        if len(seen_keys):
+            mask &= ~np.isin(columns["timestamp_device"], list(seen_keys))
+        if not mask.any():
+            return {}
+        return {field: values[mask] for field, values in columns.items()}
+
+    @staticmethod
+    def _archived_columns(blocks, start_timestamp=None, end_timestamp=None):
+        """Decode archived blocks into columns, optionally trimmed to a window"""
+        builder = _ColumnBuilder()
+        for block in blocks:
+            item = {field: {"S": block[field]} for field in ARCHIVE_INDEX_FIELDS[:4]}
+            item["columns"] = {"B": block["columns"]}
+            builder.add_block(item)
+        columns = builder.build()
+        if not columns or start_timestamp is None:
+            return columns
+        mask = (columns["timestamp"] >= start_timestamp) & (
+            columns["timestamp"] <= end_timestamp
+        )
+        return {field: values[mask] for field, values in columns.items()}
+
+    def load_columns_for_dates(self, dates, max_workers=None):
+        """Load whole days in parallel as {date_str: {field: numpy array}}"""
+        days = self._map_days(self.load_columns_by_date, dates, max_workers)
+        return dict(zip(dates, days))
+
+    def _load_columns(self, query_kwargs):
+        builder = _ColumnBuilder()
+        for items in self._query_wire_pages(query_kwargs):
+            builder.add_items(items)
+        return builder.build()
+
+    def _query_wire_pages(self, query_kwargs):
+        """Yield the wire-format items of each page of a low-level query"""
+        query_kwargs = dict(query_kwargs, TableName=self.table_name)
+        client = self._low_level_client()
+        while True:
+            response = client.query(**query_kwargs)
+            yield response["Items"]
+            if "LastEvaluatedKey" not in response:
+                return
+            query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def _low_level_client(self):
+        """A client without the resource layer's Decimal (de)serialization
+
+        Unlike the boto3 resource, a client is safe to share between
+        threads; only creating it is not, hence the lock.
+        """
+        with self._client_lock:
+            if self._client is None:
+                import boto3
+
+                meta = self.dynamodb.meta.client.meta
+                self._client = instrument_boto_client(
+                    boto3.client(
+                        "dynamodb",
+                        region_name=meta.region_name,
+                        endpoint_url=meta.endpoint_url,
+                    )
+                )
+            return self._client
+
+    def get_readings_between(self, date_str, start_timestamp, end_timestamp):
+        """Get one day's readings with start_timestamp <= timestamp <= end_timestamp
+
+        The bounds are pushed into the key condition on timestamp_device
+        ("<epoch>#<device>"), so only matching rows are read.
+        """
+        return self._query_all(
+            {
+                "KeyConditionExpression": "#date = :date AND "
+                "timestamp_device BETWEEN :start AND :end",
+                "ExpressionAttributeNames": {"#date": "date"},
+                "ExpressionAttributeValues": {
+                    ":date": date_str,
+                    ":start": str(start_timestamp),
+                    # "~" sorts after every character used in device ids
+                    ":end": f"{end_timestamp}#~",
+                },
+                "ScanIndexForward": True,
+            }
+        )
+
+    def _query_all(self, query_kwargs):
+        return list(self._iter_query(query_kwargs))
+
+    def _iter_query(self, query_kwargs):
+        """Yield every item of a query, fetching one page at a time
+
+        Days are queried from a thread pool (see _map_days), so this runs on
+        the low-level client rather than the shared boto3 resource. Values
+        go in and come out typed as the resource would have them.
+        """
+        query_kwargs = dict(query_kwargs)
+        if "ExpressionAttributeValues" in query_kwargs:
+            query_kwargs["ExpressionAttributeValues"] = _serialize_item(
+                query_kwargs["ExpressionAttributeValues"]
+            )
+        for items in self._query_wire_pages(query_kwargs):
+            for item in items:
+                yield _deserialize_item(item)
+
+    def iter_readings(self, start_date, end_date, chunk_size=None):
+        """Lazily yield readings from start_date to end_date in timestamp order
+
+        Days are streamed one query page at a time and nothing is sorted in
+        memory: each day's partition is already in timestamp order and days
+        follow each other. With chunk_size, lists of up to that many
+        readings are yielded instead of single readings.
+        """
+        readings = (
+            reading
+            for date_str in self.date_strings(start_date, end_date)
+            for reading in self._iter_day(date_str)
+        )
+        if not chunk_size:
+            yield from readings
+            return
+
+        chunk = []
+        for reading in readings:
+            chunk.append(reading)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _iter_day(self, date_str):
+        """Yield one day's readings in timestamp order, decoding packed blocks"""
+        archived = self._archived_blocks(date_str)
+        if archived is not None:
+            yield from self._expand_blocks(archived)
+            return
+
+        # Merge raw items with the day's blocks; duplicates left mid-compaction
+        # end up next to each other and are skipped
+        blocks = [self._unpack_block(block) for block in self._get_blocks(date_str)]
+        raw = self._iter_query(
+            {
+                "KeyConditionExpression": "#date = :date AND timestamp_device < :prefix",
+                "ExpressionAttributeNames": {"#date": "date"},
+                "ExpressionAttributeValues": {
+                    ":date": date_str,
+                    ":prefix": BLOCK_PREFIX,
+                },
+            }
+        )
+        previous = None
+        for reading in heapq.merge(
+            raw, *blocks, key=lambda x: (int(x["timestamp"]), x["timestamp_device"])
+        ):
+            if reading["timestamp_device"] != previous:
+                yield reading
+            previous = reading["timestamp_device"]
+
+    def get_readings_date_range(self, start_date, end_date, max_workers=None):
+        """Get readings across multiple dates (for charting)
+
+        Each day is queried in parallel and the per-day results, which
+        DynamoDB already returns in timestamp order, are merged rather than
+        re-sorted. Days in archived months are read from the archive instead
+        of the table.
+        """
+        dates = self.date_strings(start_date, end_date)
+        return self._query_days(self.get_readings_by_date, dates, max_workers)
+
+    def get_readings_for_dates(self, dates, max_workers=None):
+        """Get whole days of readings in parallel as {date_str: readings}"""
+        days = self._map_days(self.get_readings_by_date, dates, max_workers)
+        return dict(zip(dates, days))
+
+    def get_readings_time_window(self, start_time, end_time, max_workers=None):
+        """Get readings with start_time <= time <= end_time (inclusive)
+
+        Takes UTC datetimes (naive values are treated as UTC) and only reads
+        the rows inside the window from each UTC day it touches.
+        """
+        start_time = as_utc(start_time)
+        end_time = as_utc(end_time)
+        start_timestamp = int(start_time.timestamp())
+        end_timestamp = int(end_time.timestamp())
+
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+        def query_day(date_str):
+            archived = self._archived_blocks(date_str)
+            if archived is not None:
+                return [
+                    reading
+                    for reading in self._expand_blocks(archived)
+                    if start_timestamp <= reading["timestamp"] <= end_timestamp
+                ]
+            readings = self.get_readings_between(
+                date_str, start_timestamp, end_timestamp
+            )
+            if date_str < today:
+                # Only completed days can have been compacted
+                blocks = self._get_blocks(date_str)
+                if blocks:
+                    readings = [
+                        reading
+                        for reading in self._expand_blocks(readings + blocks)
+                        if start_timestamp <= reading["timestamp"] <= end_timestamp
+                    ]
+            return readings
+
+        dates = self.date_strings(
+            start_time.strftime("%Y-%m-%d"), end_time.strftime("%Y-%m-%d")
+        )
+        return self._query_days(query_day, dates, max_workers)
+
+    @classmethod
+    def _query_days(cls, query_day, dates, max_workers):
+        """Run query_day for every date in parallel and merge by timestamp"""
+        days = cls._map_days(query_day, dates, max_workers)
+        return list(heapq.merge(*days, key=lambda x: x["timestamp"]))
+
+    @staticmethod
+    def _map_days(query_day, dates, max_workers):
+        """Run query_day for every date in parallel, preserving date order
+
+        query_day runs on worker threads, so it must not touch the boto3
+        resource; _iter_query and _query_wire_pages use the low-level client.
+        """
+        if not dates:
+            return []
+        if max_workers is None:
+            max_workers = int(
+                os.environ.get("DYNAMODB_QUERY_WORKERS", DEFAULT_QUERY_WORKERS)
+            )
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(dates)))
+        ) as executor:
+            return list(executor.map(query_day, dates))
+
+    @staticmethod
+    def date_strings(start_date, end_date):
+        """List every YYYY-MM-DD date from start_date to end_date inclusive"""
+        current_date = datetime.strptime(start_date, "%Y-%m-%d")
+        end_date_obj = datetime.strptime(end_date, "%Y-%m-%d")
+
+        dates = []
+        while current_date <= end_date_obj:
+            dates.append(current_date.strftime("%Y-%m-%d"))
+            current_date += timedelta(days=1)
+        return dates
+
+
+def as_utc(value):
+    """Return an aware UTC datetime, treating naive datetimes as UTC"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+class _ColumnBuilder:
+    """Collect DynamoDB wire-format items into typed column arrays"""
+
+    def __init__(self):
+        self.count = 0
+        self.has_blocks = False
+        # field -> (row indices, values); missing rows are filled in build()
+        self.columns = {}
+        self.kinds = {}
+
+    def add_items(self, items):
+        for item in items:
+            if "layout" in item:
+                self.add_block(item)
+            else:
+                self.add_item(item)
+
+    def add_item(self, item):
+        row = self.count
+        for field, attribute in item.items():
+            kind, value = next(iter(attribute.items()))
+            if kind == "N":
+                value = float(value)
+            elif kind == "BOOL":
+                kind, value = "N", float(value)
+            elif kind != "S":
+                continue
+            self._append(field, kind, row, value)
+        self.count += 1
+
+    def add_block(self, item):
+        """Decode a packed block item directly into columns"""
+        self.has_blocks = True
+        header, timestamps, numeric = DynamoDBClient._decode_block_payload(
+            item["columns"]["B"]
+        )
+        rows = range(self.count, self.count + len(timestamps))
+        device_short_id = item["timestamp_device"]["S"][len(BLOCK_PREFIX) :]
+
+        self._extend("timestamp", "N", rows, timestamps)
+        self._extend(
+            "timestamp_device",
+            "S",
+            rows,
+            [f"{timestamp}#{device_short_id}" for timestamp in timestamps],
+        )
+        self._extend(
+            "readable_time",
+            "S",
+            rows,
+            [datetime.utcfromtimestamp(t).isoformat() for t in timestamps],
+        )
+        for field in ("date", "device_id", "device_name"):
+            self._extend(field, "S", rows, [item[field]["S"]] * len(timestamps))
+        for field, column in zip(header["numeric"], numeric):
+            self._extend(field, "N", rows, column)
+        for field, values in header["text"].items():
+            present = [(row, v) for row, v in zip(rows, values) if v is not None]
+            self._extend(field, "S", [r for r, _ in present], [v for _, v in present])
+        self.count += len(timestamps)
+
+    def _append(self, field, kind, row, value):
+        column = self.columns.get(field)
+        if column is None:
+            column = self.columns[field] = ([], [])
+            self.kinds[field] = kind
+        column[0].append(row)
+        column[1].append(value)
+
+    def _extend(self, field, kind, rows, values):
+        column = self.columns.get(field)
+        if column is None:
+            column = self.columns[field] = ([], [])
+            self.kinds[field] = kind
+        column[0].extend(rows)
+        column[1].extend(values)
+
+    def build(self):
+        import numpy as np
+
+        if not self.count:
+            return {}
+
+        arrays = {}
+        for field, (rows, values) in self.columns.items():
+            if self.kinds[field] == "N":
+                array_ = np.full(self.count, np.nan)
+            else:
+                array_ = np.full(self.count, None, dtype=object)
+            array_[np.asarray(rows, dtype=np.int64)] = values
+            arrays[field] = array_
+
+        if self.has_blocks:
+            # Drop readings still present as raw items mid-compaction, then
+            # restore timestamp order
+            _, first = np.unique(arrays["timestamp_device"], return_index=True)
+            order = first[np.argsort(arrays["timestamp"][first], kind="stable")]
+            arrays = {field: values[order] for field, values in arrays.items()}
+
+        arrays["timestamp"] = arrays["timestamp"].astype(np.int64)
+        return arrays
+
+
+def _serialize_item(item):
+    """Python values (str, int, Decimal, ...) to DynamoDB's wire format"""
+    from boto3.dynamodb.types import TypeSerializer
+
+    serializer = TypeSerializer()
+    return {name: serializer.serialize(value) for name, value in item.items()}
+
+
+def _deserialize_item(item):
+    """DynamoDB's wire format to the values the boto3 resource returns"""
+    from boto3.dynamodb.types import TypeDeserializer
+
+    deserializer = TypeDeserializer()
+    return {name: deserializer.deserialize(value) for name, value in item.items()}
+
+
+def _concat_columns(days):
+    """Concatenate per-day column dicts, filling fields missing from a day"""
+    import numpy as np
+
+    fields = {}
+    for day in days:
+        for field, values in day.items():
+            fields.setdefault(field, values.dtype)
+
+    columns = {}
+    for field, dtype in fields.items():
+        parts = []
+        for day in days:
+            if field in day:
+                parts.append(day[field])
+            else:
+                missing = None if dtype == object else np.nan
+                parts.append(np.full(len(day["timestamp"]), missing, dtype=dtype))
+        columns[field] = np.concatenate(parts)
+    return columns
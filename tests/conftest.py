@@ -0,0 +1,56 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+TABLE_NAME = "test-readings"
+
+
+@pytest.fixture
+def table(monkeypatch):
+    """A moto DynamoDB table with the readings key schema"""
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    for name, value in {
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "DYNAMODB_TABLE": TABLE_NAME,
+    }.items():
+        monkeypatch.setenv(name, value)
+    for name in ("ROLLUPS_ENABLED", "ARCHIVE_DIR", "LOCAL_DYNAMODB"):
+        monkeypatch.delenv(name, raising=False)
+
+    with moto.mock_aws():
+        resource = boto3.resource("dynamodb", region_name="us-east-1")
+        resource.create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[
+                {"AttributeName": "date", "KeyType": "HASH"},
+                {"AttributeName": "timestamp_device", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "date", "AttributeType": "S"},
+                {"AttributeName": "timestamp_device", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield resource
+
+
+def make_reading(timestamp, device="d1", **values):
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    reading = {
+        "date": moment.strftime("%Y-%m-%d"),
+        "timestamp_device": f"{timestamp}#{device}",
+        "device_id": f"enterprises/test/devices/{device}",
+        "device_name": f"Room {device}",
+        "timestamp": timestamp,
+        "readable_time": moment.replace(tzinfo=None).isoformat(),
+    }
+    reading.update(values)
+    return reading
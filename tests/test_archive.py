@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+
+from conftest import TABLE_NAME, make_reading
+from src.storage import DynamoDBClient, ReadingArchive
+
+MONTH_START = int(datetime(2024, 3, 1, tzinfo=timezone.utc).timestamp())
+
+
+def month_readings(client):
+    return [
+        (r["timestamp_device"], r.get("temperature_celsius"), r.get("humidity_percent"))
+        for r in client.get_readings_date_range("2024-03-01", "2024-03-31")
+    ]
+
+
+def table_keys(table):
+    return [
+        item["timestamp_device"] for item in table.Table(TABLE_NAME).scan()["Items"]
+    ]
+
+
+def test_archive_round_trip(table, tmp_path):
+    client = DynamoDBClient(
+        TABLE_NAME, dynamodb=table, archive=ReadingArchive(str(tmp_path))
+    )
+    client.save_readings(
+        [
+            make_reading(MONTH_START + day * 86400 + i * 900, device, **values)
+            for day in (0, 15, 30)
+            for i in range(3)
+            for device, values in (
+                ("d1", {"temperature_celsius": 20 + i / 4, "humidity_percent": 40}),
+                ("d2", {"temperature_celsius": 18.5, "weather": "clear"}),
+            )
+        ]
+    )
+    client.compact_day("2024-03-16")
+    before = month_readings(client)
+
+    assert client.archive_month("2024-03") == 18
+    assert table_keys(table) == []
+    assert month_readings(client) == before
+    assert client.archive_month("2024-03") == 0
+
+
+def test_rerun_merges_late_writes_into_the_archive(table, tmp_path):
+    client = DynamoDBClient(
+        TABLE_NAME, dynamodb=table, archive=ReadingArchive(str(tmp_path))
+    )
+    client.save_readings([make_reading(MONTH_START, temperature_celsius=20.0)])
+    client.archive_month("2024-03")
+
+    # A late redelivery after the month was archived
+    client.save_readings(
+        [
+            make_reading(MONTH_START, humidity_percent=41),
+            make_reading(MONTH_START + 900, temperature_celsius=21.0),
+        ]
+    )
+    assert client.archive_month("2024-03") == 2
+    assert table_keys(table) == []
+    assert month_readings(client) == [
+        (f"{MONTH_START}#d1", 20.0, 41),
+        (f"{MONTH_START + 900}#d1", 21.0, None),
+    ]
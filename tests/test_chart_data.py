@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from chart_data import RunningStats, decimate_lttb, decimate_minmax
+
+
+@pytest.fixture
+def series():
+    x = np.arange(1000, dtype=np.int64) * 60
+    y = np.sin(np.arange(1000) / 50.0)
+    y[437] = 5.0
+    y[712] = -5.0
+    return x, y
+
+
+@pytest.mark.parametrize("decimate", [decimate_lttb, decimate_minmax])
+def test_decimation_keeps_ends_order_and_peaks(series, decimate):
+    x, y = series
+    keep = decimate(x, y, 100)
+
+    assert len(keep) <= 100
+    assert np.all(np.diff(keep) > 0)
+    assert 437 in keep and 712 in keep
+
+
+def test_lttb_keeps_first_and_last_points(series):
+    x, y = series
+    keep = decimate_lttb(x, y, 100)
+
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == len(x) - 1
+
+
+def test_minmax_keeps_each_buckets_extremes(series):
+    x, y = series
+    keep = decimate_minmax(x, y, 100)
+
+    for bucket in np.array_split(np.arange(len(x)), 50):
+        assert bucket[np.argmin(y[bucket])] in keep
+        assert bucket[np.argmax(y[bucket])] in keep
+
+
+@pytest.mark.parametrize("decimate", [decimate_lttb, decimate_minmax])
+def test_short_series_are_not_decimated(series, decimate):
+    x, y = series
+    np.testing.assert_array_equal(decimate(x[:50], y[:50], 100), np.arange(50))
+
+
+def test_running_stats_match_numpy_across_batches():
+    rng = np.random.default_rng(0)
+    values = rng.normal(21.0, 2.0, 10_000)
+    values[::97] = np.nan
+    stats = RunningStats()
+    for batch in np.array_split(values, 7):
+        stats.update(batch)
+    stats.update(np.array([]))
+
+    clean = values[~np.isnan(values)]
+    assert stats.count == len(clean)
+    assert stats.mean == pytest.approx(clean.mean())
+    assert stats.std == pytest.approx(clean.std(ddof=1))
+    assert stats.min == clean.min() and stats.max == clean.max()
+
+
+def test_running_stats_quantiles_to_a_tenth():
+    values = np.round(np.linspace(15.0, 25.0, 1001), 1)
+    stats = RunningStats(histogram=True)
+    stats.update(values[:500])
+    stats.update(values[500:])
+
+    for q in (0.1, 0.5, 0.9):
+        assert stats.quantile(q) == pytest.approx(np.quantile(values, q), abs=0.1)
+
+
+def test_running_stats_of_nothing():
+    stats = RunningStats()
+    stats.update(np.array([np.nan]))
+
+    assert stats.count == 0
+    assert stats.std == 0.0
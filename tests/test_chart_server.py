@@ -0,0 +1,69 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import TABLE_NAME, make_reading
+from src.storage import DynamoDBClient
+
+pytest.importorskip("matplotlib")
+pd = pytest.importorskip("pandas")
+
+
+@pytest.fixture
+def store(table, monkeypatch, tmp_path):
+    monkeypatch.setenv("CHART_CACHE_DIR", str(tmp_path))
+    from chart_server import SeriesStore
+
+    return SeriesStore(DynamoDBClient(TABLE_NAME, dynamodb=table))
+
+
+def test_live_day_picks_up_readings_in_an_already_read_second(store):
+    now = int(time.time()) - 60
+    window = (
+        datetime.fromtimestamp(now - 60, timezone.utc),
+        datetime.fromtimestamp(now + 60, timezone.utc),
+    )
+    store.client.save_readings([make_reading(now, "d2")])
+    df, _ = store.raw_frame(*window)
+    assert sorted(df["timestamp_device"]) == [f"{now}#d2"]
+
+    # d1 sorts before d2 but lands after the first read
+    store.client.save_readings([make_reading(now, "d1")])
+    df, _ = store.raw_frame(*window)
+    assert sorted(df["timestamp_device"]) == [f"{now}#d1", f"{now}#d2"]
+
+    df, _ = store.raw_frame(*window)
+    assert len(df) == 2
+
+
+def test_slow_loads_do_not_block_other_days(store):
+    cached_day = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    store._remember(
+        "2024-03-01", pd.DataFrame([make_reading(int(cached_day.timestamp()))])
+    )
+
+    entered, release = threading.Event(), threading.Event()
+    load = store.client.load_columns_for_dates
+
+    def slow_load(dates):
+        entered.set()
+        release.wait(5)
+        return load(dates)
+
+    store.client.load_columns_for_dates = slow_load
+    slow_day = datetime(2024, 3, 2, tzinfo=timezone.utc)
+    loading = threading.Thread(
+        target=store.raw_frame, args=(slow_day, slow_day + timedelta(hours=1))
+    )
+    loading.start()
+    try:
+        assert entered.wait(5)
+        started = time.monotonic()
+        df, _ = store.raw_frame(cached_day, cached_day + timedelta(hours=1))
+        assert time.monotonic() - started < 1
+        assert len(df) == 1
+    finally:
+        release.set()
+        loading.join()
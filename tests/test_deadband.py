@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import TABLE_NAME, make_reading
+from src import lambda_function
+from src.lambda_function import save_polled_readings
+from src.storage import DynamoDBClient
+
+HOUR_START = datetime(2024, 3, 1, 12, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def deadband(monkeypatch, table):
+    monkeypatch.setenv("DEADBAND_ENABLED", "true")
+    monkeypatch.setenv("DEADBAND_HEARTBEAT_MINUTES", "60")
+    monkeypatch.setattr(lambda_function, "_deadband_state", {"devices": None})
+    return table
+
+
+def test_skipped_readings_count_towards_rollups(deadband):
+    client = DynamoDBClient(TABLE_NAME, dynamodb=deadband, rollups=True)
+    start = int(HOUR_START.timestamp())
+
+    written = [
+        save_polled_readings(
+            client, [make_reading(start + i * 900, temperature_celsius=20 + i / 100)]
+        )
+        for i in range(4)
+    ]
+    assert [len(readings) for readings in written] == [1, 0, 0, 0]
+
+    rollup = client.get_rollups_time_window(
+        "hour", HOUR_START, HOUR_START + timedelta(minutes=59)
+    )[0]
+    assert rollup["count"] == 4
+    assert float(rollup["temperature_celsius_max"]) == pytest.approx(20.03)
+
+
+def test_fill_carries_the_last_reading_into_the_window(deadband):
+    pytest.importorskip("matplotlib")
+    import pandas as pd
+    from chart_data import deadband_fill
+
+    client = DynamoDBClient(TABLE_NAME, dynamodb=deadband)
+    start = int(HOUR_START.timestamp())
+    client.save_readings(
+        [
+            make_reading(start - 7200, "d1", temperature_celsius=18.0),
+            make_reading(start - 1200, "d1", temperature_celsius=19.0),
+            make_reading(start - 600, "d2", temperature_celsius=21.0),
+        ]
+    )
+    window = (HOUR_START, HOUR_START + timedelta(minutes=45))
+
+    df = deadband_fill(client, pd.DataFrame(), *window)
+    assert df["timestamp"].min() >= start
+    first = df.sort_values("timestamp").groupby("device_id").head(1)
+    assert sorted(first["temperature_celsius"]) == [19.0, 21.0]
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone
+
+from conftest import TABLE_NAME, make_reading
+from src.storage import DynamoDBClient
+
+START = int(datetime(2024, 3, 1, 12, tzinfo=timezone.utc).timestamp())
+END = datetime(2024, 3, 1, 13, tzinfo=timezone.utc)
+
+
+def keys(columns):
+    return sorted(columns.get("timestamp_device", []))
+
+
+def test_rereads_the_last_second_without_repeating_seen_keys(table):
+    client = DynamoDBClient(TABLE_NAME, dynamodb=table)
+    client.save_readings([make_reading(START, "d2"), make_reading(START + 60, "d2")])
+
+    first = client.load_columns_after(START, END)
+    assert keys(first) == [f"{START}#d2", f"{START + 60}#d2"]
+
+    # d1 sorts before d2 but lands after the previous read
+    client.save_readings(
+        [make_reading(START + 60, "d1"), make_reading(START + 120, "d1")]
+    )
+    second = client.load_columns_after(START + 60, END, {f"{START + 60}#d2"})
+    assert keys(second) == [f"{START + 60}#d1", f"{START + 120}#d1"]
+
+    assert client.load_columns_after(START + 120, END, {f"{START + 120}#d1"}) == {}
+    assert client.load_columns_after(START, END - timedelta(hours=2)) == {}
@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+
+from conftest import TABLE_NAME, make_reading
+from src.storage import DynamoDBClient
+
+DAY = "2024-03-01"
+DAY_START = int(datetime(2024, 3, 1, tzinfo=timezone.utc).timestamp())
+WINDOW = (
+    datetime(2024, 3, 1, 1, tzinfo=timezone.utc),
+    datetime(2024, 3, 1, 3, tzinfo=timezone.utc),
+)
+
+
+def save_day(client):
+    readings = [
+        make_reading(DAY_START + i * 900, device, temperature_celsius=20 + i / 10)
+        for i in range(16)
+        for device in ("d1", "d2")
+    ]
+    client.save_readings(readings)
+    return readings
+
+
+def window_keys(client):
+    """timestamp_device keys of WINDOW through every window reader"""
+    readings = client.get_readings_time_window(*WINDOW)
+    columns = client.load_columns_time_window(*WINDOW)
+    pages = list(client.iter_column_pages(*WINDOW))
+    return (
+        sorted(r["timestamp_device"] for r in readings),
+        sorted(columns.get("timestamp_device", [])),
+        sorted(key for page in pages for key in page["timestamp_device"]),
+    )
+
+
+def test_window_reads_include_compacted_days(table):
+    client = DynamoDBClient(TABLE_NAME, dynamodb=table)
+    save_day(client)
+    before = window_keys(client)
+    assert len(before[0]) == 18
+
+    assert client.compact_day(DAY) == 32
+    assert window_keys(client) == before
+
+
+def test_window_reads_skip_raw_items_left_mid_compaction(table):
+    client = DynamoDBClient(TABLE_NAME, dynamodb=table)
+    readings = save_day(client)
+    before = window_keys(client)
+
+    client.compact_day(DAY)
+    # An interrupted compaction leaves raw items next to their blocks
+    client.save_readings(readings[:8])
+    assert window_keys(client) == before
+
+
+def test_compaction_classifies_fields_from_non_null_values(table):
+    client = DynamoDBClient(TABLE_NAME, dynamodb=table)
+    client.save_readings(
+        [
+            make_reading(DAY_START, temperature_celsius=20.5, humidity_percent=None),
+            make_reading(
+                DAY_START + 900, temperature_celsius=21.0, humidity_percent=40
+            ),
+            make_reading(DAY_START + 1800, humidity_percent=41, note="door open"),
+            make_reading(DAY_START + 2700, note=None),
+        ]
+    )
+
+    assert client.compact_day(DAY) == 4
+    readings = client.get_readings_by_date(DAY)
+    assert [r.get("humidity_percent") for r in readings] == [None, 40, 41, None]
+    assert [r.get("temperature_celsius") for r in readings] == [20.5, 21.0, None, None]
+    assert [r.get("note") for r in readings] == [None, None, "door open", None]
+
+
+def test_resaving_a_compacted_reading_does_not_recount_it(table):
+    client = DynamoDBClient(TABLE_NAME, dynamodb=table, rollups=True)
+    reading = make_reading(DAY_START + 600, temperature_celsius=20.0)
+    client.save_readings([reading])
+    client.compact_day(DAY)
+
+    # A retry or redelivery after the raw key was deleted
+    client.save_readings([reading])
+
+    rollups = client.get_rollups_time_window(
+        "hour",
+        datetime(2024, 3, 1, tzinfo=timezone.utc),
+        datetime(2024, 3, 1, 0, 59, tzinfo=timezone.utc),
+    )
+    assert [r["count"] for r in rollups] == [1]
+    assert [r["timestamp_device"] for r in client.get_readings_by_date(DAY)] == [
+        reading["timestamp_device"]
+    ]
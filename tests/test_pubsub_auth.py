@@ -0,0 +1,25 @@
+from src.lambda_function import pubsub_handler
+
+
+def push(token=None):
+    event = {"body": "not json"}
+    if token is not None:
+        event["queryStringParameters"] = {"token": token}
+    return pubsub_handler(event, None)["statusCode"]
+
+
+def test_rejects_every_push_without_a_configured_token(monkeypatch):
+    monkeypatch.delenv("PUBSUB_VERIFICATION_TOKEN", raising=False)
+    assert push() == 403
+    assert push("") == 403
+
+    monkeypatch.setenv("PUBSUB_VERIFICATION_TOKEN", "")
+    assert push("") == 403
+
+
+def test_checks_the_token(monkeypatch):
+    monkeypatch.setenv("PUBSUB_VERIFICATION_TOKEN", "s3cret-token-value")
+    assert push() == 403
+    assert push("wrong") == 403
+    # Accepted, then acknowledged as malformed
+    assert push("s3cret-token-value") == 204
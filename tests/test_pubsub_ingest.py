@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta, timezone
+
+from conftest import TABLE_NAME, make_reading
+from src.lambda_function import ReadingBatcher
+from src.storage import DynamoDBClient
+
+START = int(datetime(2024, 3, 1, 12, tzinfo=timezone.utc).timestamp())
+
+
+def push(client, **values):
+    ReadingBatcher(client, max_size=1, max_wait_ms=0).submit(
+        [make_reading(START, **values)]
+    )
+
+
+def test_separate_trait_events_merge_into_one_reading(table):
+    client = DynamoDBClient(TABLE_NAME, dynamodb=table, rollups=True)
+    push(client, temperature_celsius=21.5)
+    push(client, humidity_percent=45)
+
+    readings = client.get_readings_by_date("2024-03-01")
+    assert [(r["temperature_celsius"], r["humidity_percent"]) for r in readings] == [
+        (21.5, 45)
+    ]
+
+    hour = datetime.fromtimestamp(START, timezone.utc)
+    rollup = client.get_rollups_time_window("hour", hour, hour + timedelta(minutes=59))[
+        0
+    ]
+    assert rollup["count"] == 1
+    assert rollup["temperature_celsius_count"] == 1
+    assert rollup["humidity_percent_count"] == 1
+
+    # A redelivery changes nothing
+    push(client, humidity_percent=45)
+    rollup = client.get_rollups_time_window("hour", hour, hour + timedelta(minutes=59))[
+        0
+    ]
+    assert rollup["humidity_percent_count"] == 1
@@ -0,0 +1,63 @@
+import os
+
+import pandas as pd
+
+from reading_cache import COMPLETE_DAY_GRACE, ReadingCache
+
+
+def frame(rows):
+    return pd.DataFrame({"timestamp": range(rows), "temperature_celsius": 20.0})
+
+
+def test_round_trip_and_miss(tmp_path):
+    cache = ReadingCache(cache_dir=str(tmp_path), max_mb=1)
+    df = frame(10)
+    cache.put("2024-03-01", df)
+
+    pd.testing.assert_frame_equal(cache.get("2024-03-01"), df)
+    assert cache.get("2024-03-02") is None
+
+
+def test_sources_do_not_share_entries(tmp_path):
+    local = ReadingCache(cache_dir=str(tmp_path), source="readings@http://localhost")
+    aws = ReadingCache(cache_dir=str(tmp_path), source="readings@None")
+    local.put("2024-03-01", frame(3))
+
+    assert aws.get("2024-03-01") is None
+    assert local.get("2024-03-01") is not None
+
+
+def test_corrupt_file_is_dropped_and_read_as_a_miss(tmp_path):
+    cache = ReadingCache(cache_dir=str(tmp_path), max_mb=1)
+    cache.put("2024-03-01", frame(10))
+    path = cache._path("2024-03-01")
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) // 2)
+
+    assert cache.get("2024-03-01") is None
+    assert not os.path.exists(path)
+
+
+def test_evicts_least_recently_used_days(tmp_path):
+    cache = ReadingCache(cache_dir=str(tmp_path), max_mb=1)
+    days = ["2024-03-01", "2024-03-02", "2024-03-03"]
+    for i, day in enumerate(days):
+        cache.put(day, frame(10))
+        os.utime(cache._path(day), (1000 + i, 1000 + i))
+    # Reading the oldest day makes it the most recently used
+    cache.get("2024-03-01")
+
+    sizes = [os.path.getsize(cache._path(day)) for day in days]
+    cache.max_bytes = sum(sizes) - 1
+    cache.evict()
+
+    assert cache.get("2024-03-02") is None
+    assert cache.get("2024-03-01") is not None
+    assert cache.get("2024-03-03") is not None
+
+
+def test_is_complete_waits_for_the_grace_period():
+    day_end = pd.Timestamp("2024-03-02", tz="UTC").to_pydatetime()
+
+    assert not ReadingCache.is_complete("2024-03-01", now=day_end)
+    assert ReadingCache.is_complete("2024-03-01", now=day_end + COMPLETE_DAY_GRACE)
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+
+from conftest import TABLE_NAME, make_reading
+from src.storage import DynamoDBClient
+
+DAY_START = int(datetime(2024, 3, 1, tzinfo=timezone.utc).timestamp())
+
+
+def test_iter_readings_merges_raw_items_and_blocks(table):
+    client = DynamoDBClient(TABLE_NAME, dynamodb=table)
+    readings = [
+        make_reading(DAY_START + i * 900, device, temperature_celsius=20.0)
+        for i in range(4)
+        for device in ("d1", "d2")
+    ]
+    client.save_readings(readings)
+    client.compact_day("2024-03-01")
+    # Raw items left by an interrupted compaction, plus a late reading
+    client.save_readings(readings[3:6] + [make_reading(DAY_START + 4000, "d1")])
+
+    keys = [
+        r["timestamp_device"] for r in client.iter_readings("2024-03-01", "2024-03-01")
+    ]
+    expected = sorted(
+        {r["timestamp_device"] for r in readings} | {f"{DAY_START + 4000}#d1"},
+        key=lambda key: (int(key.split("#")[0]), key),
+    )
+    assert keys == expected
+
+
+def test_parallel_day_queries_do_not_use_the_shared_resource(table, monkeypatch):
+    """boto3 resources are not thread-safe; day queries run on a thread pool"""
+    client = DynamoDBClient(TABLE_NAME, dynamodb=table)
+    client.save_readings([make_reading(DAY_START + day * 86400) for day in range(3)])
+
+    def fail(**kwargs):
+        raise AssertionError("queried through the boto3 resource")
+
+    monkeypatch.setattr(client.table, "query", fail)
+    readings = client.get_readings_date_range("2024-03-01", "2024-03-03")
+    assert [r["timestamp"] for r in readings] == [
+        DAY_START + day * 86400 for day in range(3)
+    ]
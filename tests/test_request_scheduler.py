@@ -0,0 +1,185 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from src import lambda_function
+from src.lambda_function import RequestScheduler
+
+URL = "https://api.example.com/v1/devices"
+
+
+class FakeClock:
+    """Stands in for time.monotonic/time.sleep; sleeping advances the clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSession:
+    """Returns queued responses (or raises queued exceptions) in order"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = []
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.calls.append((method, url, timeout))
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class FakeContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(lambda_function.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(lambda_function.time, "sleep", clock.sleep)
+    # Backoff is full jitter; take the upper bound so delays are predictable
+    monkeypatch.setattr(lambda_function.random, "uniform", lambda low, high: high)
+    monkeypatch.delenv("REQUEST_TIMEOUT", raising=False)
+    return clock
+
+
+def test_retries_throttling_and_server_errors_with_backoff(clock):
+    session = FakeSession(FakeResponse(429), FakeResponse(503), FakeResponse(200))
+    scheduler = RequestScheduler(rate=100, burst=100, max_retries=4)
+
+    response = scheduler.request(session, "GET", URL)
+
+    assert response.status_code == 200
+    assert len(session.calls) == 3
+    assert clock.sleeps == [0.5, 1.0]
+
+
+def test_gives_up_after_max_retries(clock):
+    session = FakeSession(*[FakeResponse(500) for _ in range(3)])
+    scheduler = RequestScheduler(rate=100, burst=100, max_retries=2)
+
+    # The last response is returned so callers still raise_for_status()
+    assert scheduler.request(session, "GET", URL).status_code == 500
+    assert len(session.calls) == 3
+
+
+def test_client_errors_are_not_retried(clock):
+    session = FakeSession(FakeResponse(404))
+    scheduler = RequestScheduler(rate=100, burst=100, max_retries=4)
+
+    assert scheduler.request(session, "GET", URL).status_code == 404
+    assert clock.sleeps == []
+
+
+def test_retries_connection_errors(clock):
+    requests = pytest.importorskip("requests")
+    session = FakeSession(requests.ConnectionError("reset"), FakeResponse(200))
+    scheduler = RequestScheduler(rate=100, burst=100, max_retries=1)
+
+    assert scheduler.request(session, "GET", URL).status_code == 200
+    with pytest.raises(requests.Timeout):
+        scheduler.request(
+            FakeSession(requests.Timeout("slow"), requests.Timeout("slow")),
+            "GET",
+            URL,
+        )
+
+
+def retry_after_date(seconds):
+    when = datetime.now(timezone.utc) + timedelta(seconds=seconds)
+    return format_datetime(when, usegmt=True)
+
+
+@pytest.mark.parametrize(
+    "header", ["7", lambda: retry_after_date(7)], ids=["seconds", "http-date"]
+)
+def test_honors_retry_after_and_pauses_the_host(clock, header):
+    if callable(header):
+        header = header()
+    session = FakeSession(
+        FakeResponse(429, {"Retry-After": header}), FakeResponse(200), FakeResponse(200)
+    )
+    scheduler = RequestScheduler(rate=100, burst=100, max_retries=4)
+
+    scheduler.request(session, "GET", URL)
+    assert len(clock.sleeps) == 1
+    assert 5 <= clock.sleeps[0] <= 7
+
+    # Another call to the same host made during the pause waits it out
+    clock.now -= clock.sleeps[0]
+    scheduler.request(session, "GET", URL + "/other")
+    assert 5 <= clock.sleeps[1] <= 7
+
+
+def test_retry_after_is_capped(clock):
+    session = FakeSession(FakeResponse(429, {"Retry-After": "3600"}), FakeResponse(200))
+    scheduler = RequestScheduler(rate=100, burst=100, max_retries=4)
+
+    scheduler.request(session, "GET", URL)
+    assert clock.sleeps == [lambda_function.RETRY_AFTER_CAP]
+
+
+def test_fails_fast_when_a_retry_would_pass_the_deadline(clock):
+    session = FakeSession(FakeResponse(429, {"Retry-After": "30"}), FakeResponse(200))
+    scheduler = RequestScheduler(rate=100, burst=100, max_retries=4)
+    scheduler.set_deadline(FakeContext(remaining_ms=10_000))
+
+    with pytest.raises(TimeoutError):
+        scheduler.request(session, "GET", URL)
+    assert clock.sleeps == []
+    assert len(session.calls) == 1
+
+
+def test_request_timeout_is_bounded_by_the_deadline(clock):
+    session = FakeSession(FakeResponse(200))
+    scheduler = RequestScheduler(rate=100, burst=100, max_retries=0)
+    scheduler.set_deadline(FakeContext(remaining_ms=5_000))
+
+    scheduler.request(session, "GET", URL)
+    # 5 s left minus the DEADLINE_MARGIN kept for saving readings
+    assert session.calls[0][2] == pytest.approx(5 - lambda_function.DEADLINE_MARGIN)
+
+
+def test_token_bucket_rate_limits_each_host(clock):
+    scheduler = RequestScheduler(rate=2, burst=2, max_retries=0)
+    session = FakeSession(*[FakeResponse(200) for _ in range(5)])
+
+    for _ in range(4):
+        scheduler.request(session, "GET", URL)
+    # Two calls from the burst, then one every 1/rate seconds
+    assert clock.sleeps == [0.5, 0.5]
+
+    scheduler.request(session, "GET", "https://other.example.com/")
+    assert clock.sleeps == [0.5, 0.5]
+
+
+def test_token_bucket_fails_fast_at_the_deadline(clock):
+    scheduler = RequestScheduler(rate=0.1, burst=1, max_retries=0)
+    scheduler.set_deadline(FakeContext(remaining_ms=5_000))
+    session = FakeSession(FakeResponse(200), FakeResponse(200))
+
+    scheduler.request(session, "GET", URL)
+    with pytest.raises(TimeoutError):
+        scheduler.request(session, "GET", URL)
+    assert clock.sleeps == []
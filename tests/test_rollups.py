@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+
+from conftest import TABLE_NAME, make_reading
+from src.storage import DynamoDBClient
+
+HOUR_START = datetime(2024, 3, 1, 12, tzinfo=timezone.utc)
+
+
+def hour_rollup(client, device):
+    rollups = client.get_rollups_time_window(
+        "hour", HOUR_START, HOUR_START + timedelta(minutes=59)
+    )
+    return next(r for r in rollups if r["timestamp_device"].endswith(f"#{device}"))
+
+
+def test_late_and_retried_readings(table):
+    client = DynamoDBClient(TABLE_NAME, dynamodb=table, rollups=True)
+    start = int(HOUR_START.timestamp())
+    late = make_reading(start + 600, temperature_celsius=20.0)
+
+    client.save_readings([make_reading(start + 1800, temperature_celsius=30.0)])
+    client.save_readings([late])
+    client.save_readings([late])
+
+    rollup = hour_rollup(client, "d1")
+    assert rollup["count"] == 2
+    assert rollup["temperature_celsius_min"] == 20
+    assert rollup["temperature_celsius_max"] == 30
+    assert rollup["temperature_celsius"] == 25
+
+
+def test_interleaved_writers(table):
+    """Two writers that both read the rollup before either one wrote it"""
+    start = int(HOUR_START.timestamp())
+    poller = DynamoDBClient(TABLE_NAME, dynamodb=table, rollups=True)
+    pusher = DynamoDBClient(TABLE_NAME, dynamodb=table, rollups=True)
+    # The pusher's view of the stored rollups predates the poller's write
+    pusher._batch_get = lambda keys: {}
+
+    poller.save_readings([make_reading(start, temperature_celsius=18.0)])
+    pusher.save_readings([make_reading(start + 60, temperature_celsius=22.0)])
+
+    rollup = hour_rollup(poller, "d1")
+    assert rollup["count"] == 2
+    assert rollup["temperature_celsius_sum"] == 40
+    assert rollup["temperature_celsius_min"] == 18
+    assert rollup["temperature_celsius_max"] == 22
+
+
+def test_poll_costs_one_update_per_bucket(table):
+    client = DynamoDBClient(TABLE_NAME, dynamodb=table, rollups=True)
+    calls = []
+    table.meta.client.meta.events.register(
+        "before-call.dynamodb", lambda model, **kwargs: calls.append(model.name)
+    )
+    start = int(HOUR_START.timestamp())
+
+    for poll in range(2):
+        calls.clear()
+        client.save_readings(
+            [
+                make_reading(start + poll * 900, f"d{i}", temperature_celsius=20 + i)
+                for i in range(5)
+            ]
+        )
+        # An hour and a day bucket per device
+        assert sorted(calls) == ["BatchGetItem", "BatchWriteItem"] + ["UpdateItem"] * 10
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from src import lambda_function
+from src.lambda_function import TokenCache
+
+
+@pytest.fixture
+def now(monkeypatch):
+    """Freeze time.time(); returns a one-item list so tests can move it"""
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(lambda_function.time, "time", lambda: now[0])
+    monkeypatch.setattr(lambda_function, "_token_store", {})
+    return now
+
+
+class FakeStateClient:
+    def __init__(self):
+        self.state = {}
+
+    def get_state(self, key):
+        return self.state.get(key)
+
+    def put_state(self, key, value):
+        self.state[key] = value
+
+
+def test_token_is_refreshed_refresh_margin_before_expiry(now):
+    cache = TokenCache(refresh_margin=300)
+    cache.put("home", "token-1", expires_in=3600)
+
+    now[0] += 3600 - 301
+    assert cache.get("home") == "token-1"
+    # Inside the margin the token counts as expired so it is never sent stale
+    now[0] += 1
+    assert cache.get("home") is None
+
+
+def test_refresh_margin_defaults_from_the_environment(now, monkeypatch):
+    monkeypatch.setenv("TOKEN_REFRESH_MARGIN", "60")
+    cache = TokenCache()
+    cache.put("home", "token-1", expires_in=3600)
+
+    now[0] += 3600 - 61
+    assert cache.get("home") == "token-1"
+
+
+def test_cold_start_reads_a_valid_token_from_the_file(now, tmp_path):
+    path = str(tmp_path / "tokens.json")
+    TokenCache(path=path, refresh_margin=300).put("home", "token-1", expires_in=3600)
+
+    lambda_function._token_store.clear()
+    assert TokenCache(path=path, refresh_margin=300).get("home") == "token-1"
+
+    now[0] += 3600
+    lambda_function._token_store.clear()
+    assert TokenCache(path=path, refresh_margin=300).get("home") is None
+
+
+def test_expired_file_token_falls_back_to_dynamodb_state(now, tmp_path):
+    path = tmp_path / "tokens.json"
+    path.write_text(
+        json.dumps({"home": {"access_token": "stale", "expires_at": now[0] - 1}})
+    )
+    state = FakeStateClient()
+    state.put_state(
+        "nest_token#home", {"access_token": "shared", "expires_at": now[0] + 3600}
+    )
+
+    cache = TokenCache(path=str(path), dynamodb_client=state, refresh_margin=300)
+    assert cache.get("home") == "shared"
+    # The loaded token is kept in memory for the rest of the container's life
+    assert lambda_function._token_store["home"]["access_token"] == "shared"
+
+
+def test_put_survives_a_failing_store(now, tmp_path):
+    class BrokenStateClient(FakeStateClient):
+        def put_state(self, key, value):
+            raise RuntimeError("throttled")
+
+    cache = TokenCache(dynamodb_client=BrokenStateClient(), refresh_margin=300)
+    cache.put("home", "token-1", expires_in=3600)
+    assert cache.get("home") == "token-1"